@@ -0,0 +1,49 @@
+# Compares two result files written by run_benchmarks.py.
+#
+# Usage: python benchmarks/compare.py BASELINE.json CANDIDATE.json
+
+import argparse
+import json
+
+
+def config_key(config):
+    return tuple(sorted(config.items()))
+
+
+def change(baseline, candidate):
+    if not baseline or candidate is None:
+        return "     n/a"
+    return f"{100 * (candidate - baseline) / baseline:+7.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two grayscaler benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"baseline:  {baseline['environment'].get('git_commit')}")
+    print(f"candidate: {candidate['environment'].get('git_commit')}")
+
+    baseline_results = {config_key(result["config"]): result for result in baseline["results"]}
+    print(f"{'configuration':<48}{'files/s':>10}{'p50':>10}{'p99':>10}{'peak RSS':>10}")
+    for result in candidate["results"]:
+        config = result["config"]
+        label = f"{config['mode']} w={config['workers']} {config['decode']} i={config['interval']:g}"
+        previous = baseline_results.get(config_key(config))
+        if previous is None:
+            print(f"{label:<48}  (no baseline)")
+            continue
+        print(f"{label:<48}"
+              f"{change(previous['files_per_second'], result['files_per_second']):>10}"
+              f"{change(previous['latency'].get('p50_ms'), result['latency'].get('p50_ms')):>10}"
+              f"{change(previous['latency'].get('p99_ms'), result['latency'].get('p99_ms')):>10}"
+              f"{change(previous['peak_rss_mb'], result['peak_rss_mb']):>10}")
+
+
+if __name__ == "__main__":
+    main()
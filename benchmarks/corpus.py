@@ -0,0 +1,123 @@
+# Generates reproducible synthetic image corpora for the benchmarks.
+#
+# Usage: python benchmarks/corpus.py OUTPUT_FOLDER --count 10000 [--seed 0]
+#
+# The default mix averages about 0.6 MB per image, so 100k images need roughly 60 GB of disk.
+#
+# Encoding 100k distinct images would take longer than the benchmarks themselves, so each
+# (size, format) combination gets a fixed number of distinct variants that are then reused
+# under different file names.
+
+import argparse
+import json
+import os
+import sys
+
+# (label, width, height, share of the corpus)
+SIZES = (
+    ("small", 320, 240, 0.6),
+    ("medium", 1280, 720, 0.3),
+    ("large", 3000, 2000, 0.1),
+)
+# (extension, share of the corpus)
+FORMATS = ((".jpg", 0.8), (".png", 0.15), (".bmp", 0.05))
+VARIANTS_PER_KIND = 8
+# Written into every generated corpus folder with its count and seed, so the benchmarks only ever
+# reuse or delete folders this script created
+MARKER_NAME = ".grayscaler_corpus.json"
+
+
+def make_image(rng, width, height):
+    """Smooth color noise: compresses like a photo rather than like pure noise or a flat image."""
+    import cv2
+    import numpy as np
+
+    base = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    img = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(-2, 3, img.shape, dtype=np.int16)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def build_plan(count, seed=0):
+    """
+    Decides the kind of every file in the corpus.
+
+    Returns:
+        list: (file name, size label, width, height, extension, variant) per file, in a fixed order.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    size_choices = rng.choice(len(SIZES), count, p=[size[3] for size in SIZES])
+    format_choices = rng.choice(len(FORMATS), count, p=[fmt[1] for fmt in FORMATS])
+    variants = rng.integers(0, VARIANTS_PER_KIND, count)
+    plan = []
+    for i in range(count):
+        label, width, height, _ = SIZES[size_choices[i]]
+        extension = FORMATS[format_choices[i]][0]
+        plan.append((f"img_{i:06d}_{label}{extension}", label, width, height, extension, int(variants[i])))
+    return plan
+
+
+def generate_corpus(folder, count, seed=0):
+    """
+    Writes a corpus of count images into folder. The same count and seed always give the same files.
+
+    Args:
+        folder (str): Destination folder, created if needed.
+        count (int): Number of images.
+        seed (int): Random seed. Defaults to 0.
+
+    Returns:
+        dict: Summary with the file count, total bytes and the count per size and format.
+    """
+    import cv2
+    import numpy as np
+
+    os.makedirs(folder, exist_ok=True)
+    encoded = {} # (label, extension, variant) -> encoded bytes
+    summary = {"files": count, "bytes": 0, "seed": seed, "sizes": {}, "formats": {}}
+    for name, label, width, height, extension, variant in build_plan(count, seed):
+        key = (label, extension, variant)
+        if key not in encoded:
+            size_index = [size[0] for size in SIZES].index(label)
+            rng = np.random.default_rng([seed, size_index, variant])
+            success, buffer = cv2.imencode(extension, make_image(rng, width, height))
+            if not success:
+                raise RuntimeError(f"Could not encode a {extension} test image")
+            encoded[key] = buffer.tobytes()
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(encoded[key])
+        summary["bytes"] += len(encoded[key])
+        summary["sizes"][label] = summary["sizes"].get(label, 0) + 1
+        summary["formats"][extension] = summary["formats"].get(extension, 0) + 1
+    with open(os.path.join(folder, MARKER_NAME), "w") as f:
+        json.dump({"count": count, "seed": seed}, f)
+    return summary
+
+
+def read_marker(folder):
+    """
+    Returns:
+        dict: The count and seed of the corpus generated in folder, or None if the folder does not
+            hold a complete generated corpus.
+    """
+    try:
+        with open(os.path.join(folder, MARKER_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic image corpus for benchmarking.")
+    parser.add_argument("folder")
+    parser.add_argument("--count", type=int, default=1000, help="Number of images, up to 100000 (default: 1000).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    summary = generate_corpus(args.folder, args.count, args.seed)
+    print(f"Wrote {summary['files']} images ({summary['bytes'] / 1e6:.1f} MB) to {args.folder}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Compares per-image latency and peak memory of the grayscale decode modes on large JPEGs.
+#
+# Usage: python benchmarks/decode_benchmark.py [--width 6000] [--height 4000] [--images 5]
+#
+# Each mode runs in its own subprocess so the peak RSS of one mode does not hide another's.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_benchmarks import peak_rss_mb
+
+MODES = {
+    "full_color": {"fast_decode": False, "reduce_factor": 1},
+    "fast_gray": {"fast_decode": True, "reduce_factor": 1},
+    "fast_gray_reduced_2": {"fast_decode": True, "reduce_factor": 2},
+    "fast_gray_reduced_4": {"fast_decode": True, "reduce_factor": 4},
+}
+
+
+def make_corpus(folder, count, width, height):
+    """Writes count synthetic color JPEGs with some texture, so the codec has real work to do."""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        base = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+        img = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+        path = os.path.join(folder, f"large_{i}.jpg")
+        cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        paths.append(path)
+    return paths
+
+
+def run_mode(mode, paths):
+    """Decodes every image with one mode and prints its latency and memory as JSON."""
+    import logging
+    from utility import ImageProcessor
+
+    logging.disable(logging.CRITICAL)
+    processor = ImageProcessor(output_folder=tempfile.mkdtemp(), **MODES[mode])
+    latencies = []
+    for path in paths:
+        started = time.perf_counter()
+        gray = processor._read_grayscale(path)
+        latencies.append(time.perf_counter() - started)
+        assert gray is not None and gray.ndim == 2
+        del gray
+    latencies.sort()
+    print(json.dumps({
+        "mode": mode,
+        "images": len(paths),
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "median_ms": 1000 * latencies[len(latencies) // 2],
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark grayscale decode modes on large JPEGs.")
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, sorted(os.path.join(args.corpus, f) for f in os.listdir(args.corpus)))
+        return
+
+    with tempfile.TemporaryDirectory() as corpus:
+        make_corpus(corpus, args.images, args.width, args.height)
+        results = []
+        for mode in MODES:
+            output = subprocess.run([sys.executable, __file__, "--mode", mode, "--corpus", corpus],
+                                    check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output))
+
+    reference = results[0]
+    # Every mode pays the same interpreter and import overhead, so differences in peak RSS are the decode buffers
+    print(f"{'mode':<22}{'mean ms':>10}{'median ms':>11}{'peak RSS MB':>13}{'RSS vs full':>13}{'speedup':>9}")
+    for result in results:
+        speedup = reference["mean_ms"] / result["mean_ms"]
+        rss_delta = result["peak_rss_mb"] - reference["peak_rss_mb"]
+        print(f"{result['mode']:<22}{result['mean_ms']:>10.1f}{result['median_ms']:>11.1f}"
+              f"{result['peak_rss_mb']:>13.1f}{rss_delta:>+13.1f}{speedup:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
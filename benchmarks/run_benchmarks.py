@@ -0,0 +1,302 @@
+# End-to-end benchmark harness for ImageProcessor and FileWatcher.
+#
+# Usage:
+#   python benchmarks/run_benchmarks.py --count 2000 --modes batch,watch --workers 1,4 \
+#       --decode fast,full --intervals 1 --output results.json
+#   python benchmarks/compare.py baseline.json results.json
+#
+# Every configuration runs in a fresh subprocess against a hard-linked copy of the same synthetic
+# corpus (see corpus.py), so peak RSS and CPU time are measured per configuration. Results are written
+# as JSON together with the git commit and library versions, so runs can be compared across commits.
+#
+# Modes:
+#   batch         - ImageProcessor through a WorkerPool, no watching (conversion throughput only; latency is
+#                   the conversion time in the worker, without the wait for a free worker)
+#   watch         - FileWatcher with inotify where available (full ingest pipeline)
+#   watch-polling - FileWatcher forced to poll the folder every --intervals seconds
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+DECODE_MODES = {
+    "fast": {"fast_decode": True, "reduce_factor": 1},
+    "full": {"fast_decode": False, "reduce_factor": 1},
+    "reduced2": {"fast_decode": True, "reduce_factor": 2},
+}
+
+
+def percentiles(values):
+    """Returns p50/p90/p99/max of a list of latencies, in milliseconds."""
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(fraction):
+        return 1000 * values[min(len(values) - 1, int(fraction * len(values)))]
+
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": 1000 * values[-1]}
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB. On Linux this reads VmHWM, because ru_maxrss is
+    inherited across exec and would report the parent's peak (e.g. from corpus generation).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024 # bytes on macOS, KiB elsewhere
+
+
+def link_corpus(corpus, folder):
+    """Hard-links (or copies, across file systems) every corpus file into a fresh input folder."""
+    from corpus import MARKER_NAME
+
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(corpus):
+        if name == MARKER_NAME:
+            continue
+        source = os.path.join(corpus, name)
+        try:
+            os.link(source, os.path.join(folder, name))
+        except OSError:
+            shutil.copy2(source, os.path.join(folder, name))
+
+
+def timed_process_image(*args):
+    """
+    Runs process_image in a worker and also returns how long it took there, so batch latencies
+    leave out the time a job spent waiting for a free worker.
+    """
+    from utility.workerpool import process_image
+
+    started = time.perf_counter()
+    result = process_image(*args)
+    return result, time.perf_counter() - started
+
+
+def run_batch(config, input_folder, output_folder):
+    from utility import ImageProcessor
+    from utility.workerpool import WorkerPool
+
+    processor = ImageProcessor(output_folder=output_folder, **DECODE_MODES[config["decode"]])
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+
+    def on_done(future):
+        (gray_path, _), seconds = future.result()
+        with lock:
+            if gray_path:
+                latencies.append(seconds)
+            else:
+                failures[0] += 1
+
+    pool = WorkerPool(config["workers"], config.get("processes", False))
+    for name in sorted(os.listdir(input_folder)):
+        pool.submit(on_done, timed_process_image, processor, os.path.join(input_folder, name), name, False)
+    pool.shutdown(cancel_pending=False)
+    return latencies, failures[0], time.perf_counter()
+
+
+def run_watch(config, input_folder, output_folder, expected):
+    from utility import FileWatcher, ImageProcessor, PipelineMetrics
+
+    class LatencyRecorder(PipelineMetrics):
+        """Keeps every detection-to-done latency, not just the histogram buckets."""
+        def __init__(self):
+            super().__init__()
+            self.latencies = []
+            self.finished = threading.Event()
+            self.finished_at = None
+
+        def record_success(self, stats, detected_at=None):
+            super().record_success(stats, detected_at)
+            if detected_at is not None:
+                self.latencies.append(time.time() - detected_at)
+            self._check_finished()
+
+        def increment(self, counter, amount=1):
+            super().increment(counter, amount)
+            self._check_finished()
+
+        def _check_finished(self):
+            done = self.counters["files_processed"] + self.counters["dead_lettered"]
+            if done >= expected and not self.finished.is_set():
+                self.finished_at = time.perf_counter()
+                self.finished.set()
+
+    recorder = LatencyRecorder()
+    processor = ImageProcessor(output_folder=output_folder, **DECODE_MODES[config["decode"]])
+    watcher = FileWatcher(input_folder, processor, lambda message, level: None, update_interval=config["interval"],
+                          workers=config["workers"], use_processes=config.get("processes", False),
+                          use_inotify=config["mode"] == "watch", settle_time=0, max_attempts=1,
+                          dead_letter_folder=os.path.join(os.path.dirname(input_folder), "failed"),
+                          metrics=recorder)
+    thread = threading.Thread(target=watcher.watch, daemon=True)
+    thread.start()
+    recorder.finished.wait(timeout=config.get("timeout", 3600))
+    watcher.stop() # Shutdown time is not part of the measured ingest time
+    thread.join()
+    return recorder.latencies, recorder.counters["files_failed"], recorder.finished_at or time.perf_counter()
+
+
+def run_config(config, corpus):
+    """Runs one configuration in this process and returns its measurements."""
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    workdir = tempfile.mkdtemp(prefix="grayscaler_bench_")
+    try:
+        input_folder = os.path.join(workdir, "input")
+        output_folder = os.path.join(workdir, "output")
+        link_corpus(corpus, input_folder)
+        files = len(os.listdir(input_folder))
+        input_bytes = sum(os.path.getsize(os.path.join(input_folder, name)) for name in os.listdir(input_folder))
+
+        times_before = os.times()
+        started = time.perf_counter()
+        if config["mode"] == "batch":
+            latencies, failures, finished = run_batch(config, input_folder, output_folder)
+        else:
+            latencies, failures, finished = run_watch(config, input_folder, output_folder, files)
+        wall = finished - started
+        times_after = os.times()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    cpu_seconds = sum(times_after[i] - times_before[i] for i in range(4)) # user, system, children user/system
+    return {
+        "files": files,
+        "failures": failures,
+        "wall_seconds": wall,
+        "files_per_second": files / wall if wall else None,
+        "mb_per_second": input_bytes / 1e6 / wall if wall else None,
+        "latency": percentiles(latencies),
+        "cpu_seconds": cpu_seconds,
+        "cpu_utilization": cpu_seconds / wall / (os.cpu_count() or 1) if wall else None,
+        "peak_rss_mb": peak_rss_mb(),
+        # Largest worker process with --processes (ru_maxrss is bytes on macOS, KiB elsewhere)
+        "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+                             / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    }
+
+
+def environment():
+    """Describes the code and machine the results were taken on."""
+    import cv2
+    import numpy
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "git_commit": commit,
+        "git_dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def build_configs(args):
+    configs = []
+    for mode, workers, decode in itertools.product(args.modes, args.workers, args.decode):
+        intervals = args.intervals if mode == "watch-polling" else [args.intervals[0]]
+        for interval in intervals:
+            configs.append({"mode": mode, "workers": workers, "decode": decode, "interval": interval,
+                            "processes": args.processes})
+    return configs
+
+
+def split_list(value, convert=str):
+    return [convert(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark grayscaler ingest throughput and latency.")
+    parser.add_argument("--count", type=int, default=1000, help="Images in the synthetic corpus (default: 1000).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="Reuse (or create) the corpus in this folder instead of a temporary one. "
+                             "An existing folder must be empty or hold a corpus made by corpus.py.")
+    parser.add_argument("--modes", type=split_list, default=["batch", "watch"],
+                        help="Comma-separated: batch, watch, watch-polling (default: batch,watch).")
+    parser.add_argument("--workers", type=lambda v: split_list(v, int), default=[1, os.cpu_count() or 1])
+    parser.add_argument("--decode", type=split_list, default=["fast"], help=f"Comma-separated: {', '.join(DECODE_MODES)}.")
+    parser.add_argument("--intervals", type=lambda v: split_list(v, float), default=[1.0],
+                        help="Polling intervals in seconds for watch-polling (default: 1).")
+    parser.add_argument("--processes", action="store_true", help="Use worker processes instead of threads.")
+    parser.add_argument("--output", help="Write results as JSON to this file (default: stdout).")
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_config:
+        print(json.dumps(run_config(json.loads(args.run_config), args.corpus)))
+        return
+
+    from corpus import generate_corpus, read_marker
+
+    corpus = args.corpus or tempfile.mkdtemp(prefix="grayscaler_corpus_")
+    marker = read_marker(corpus)
+    if marker is None and os.path.isdir(corpus) and os.listdir(corpus):
+        parser.error(f"{corpus} is not empty and holds no corpus generated by corpus.py; "
+                     f"refusing to replace it. Pass an empty or new folder.")
+    try:
+        if marker != {"count": args.count, "seed": args.seed}:
+            if marker is not None:
+                shutil.rmtree(corpus) # A generated corpus of another count or seed
+            print(f"Generating {args.count} images in {corpus}...", file=sys.stderr)
+            corpus_summary = generate_corpus(corpus, args.count, args.seed)
+        else:
+            corpus_summary = {"files": args.count, "seed": args.seed, "reused": True}
+
+        results = []
+        for config in build_configs(args):
+            output = subprocess.run([sys.executable, __file__, "--run-config", json.dumps(config), "--corpus", corpus],
+                                    check=True, capture_output=True, text=True).stdout
+            result = {"config": config, **json.loads(output)}
+            results.append(result)
+            print(f"{config['mode']:<14} workers={config['workers']:<3} decode={config['decode']:<9} "
+                  f"interval={config['interval']:<5g} {result['files_per_second']:8.1f} files/s  "
+                  f"p50 {result['latency'].get('p50_ms', 0):8.1f} ms  p99 {result['latency'].get('p99_ms', 0):8.1f} ms  "
+                  f"RSS {result['peak_rss_mb']:7.1f} MB  CPU {100 * result['cpu_utilization']:5.1f}%", file=sys.stderr)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus, ignore_errors=True)
+
+    document = json.dumps({"environment": environment(), "corpus": corpus_summary, "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
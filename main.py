@@ -1,311 +1,462 @@
-import os
-import customtkinter as ctk
-from tkinter import filedialog, messagebox 
-from collections import deque
-import threading
-import logging
-from datetime import datetime, timedelta, date
-
-
-#From utility Module
-from utility import FileWatcher 
-from utility import ImageProcessor
-
-#--- Global Varibalbe for the logs directory----
-LOGS_DIRECTORY = "app_run_logs"
-
-class ImageProcessingApp(object):
-    """
-    Main application class for the image processing and file watching GUI.
-    """
-    def __init__(self, root_window):
-        """
-        Initializes the main application window.
-        """
-        self.root = root_window
-        self.root.title("GrayScaler Converter")
-        self.root.geometry("750x550")
-        self.root.iconbitmap(r"icon\logo.ico")
-        self.root.minsize(700, 500)
-
-        self.setup_logging()
-        self.log_queue = deque(maxlen=200)
-
-        self.watcher_thread = None
-        self.is_watching = False
-        self.image_processor = None
-        self.watcher = None
-
-        # --- Button Styling ---
-        self.button_corner_radius = 8
-        self.button_fg_color = ("#5DADE2", "#2E86C1")  
-        self.button_hover_color = ("#85C1E9", "#3498DB")
-        self.button_text_color = ("#FFFFFF", "#FFFFFF")
-        self.button_border_width = 0
-        self.button_border_spacing = 5
-
-        self.create_widgets()
-        self.update_log_display_periodically() 
-	
-    def setup_logging(self):
-        """
-        Configures logging to create a new timestamped log file in a 'logs' directory
-        for each application run.
-        """
-        if not os.path.exists(LOGS_DIRECTORY):
-            try:
-                os.makedirs(LOGS_DIRECTORY)
-            except OSError as e:
-                print(f"CRITICAL: Could not create logs directory '{LOGS_DIRECTORY}': {e}")
-                return
-
-        current_time_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        log_filename = f"app_session_{current_time_str}.log"
-        log_filepath = os.path.join(LOGS_DIRECTORY, log_filename)
-
-        logger = logging.getLogger()
-        logger.setLevel(logging.INFO)
-
-        for handler in logger.handlers[:]:
-            logger.removeHandler(handler)
-            handler.close()
-
-        try:
-            file_handler = logging.FileHandler(log_filepath, mode='w')
-            formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(module)s - %(message)s")
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
-        except IOError as e:
-            print(f"CRITICAL: Could not create file handler for '{log_filepath}': {e}")
-
-        logging.info(f"Logging initialized. Log file: {log_filepath}")
-
-    def create_widgets(self):
-        """
-        Creates the UI elements.
-        """
-        self.root.grid_columnconfigure(1, weight=1) 
-
-        # --- Input Folder Selection ---
-        self.input_folder_label = ctk.CTkLabel(self.root, text="Monitor Folder:")
-        self.input_folder_label.grid(row=0, column=0, padx=(20, 5), pady=10, sticky="w")
-
-        self.input_folder_entry = ctk.CTkEntry(self.root, placeholder_text="Path to folder with original images")
-        self.input_folder_entry.grid(row=0, column=1, padx=5, pady=10, sticky="ew")
-
-        self.browse_input_button = ctk.CTkButton(
-            self.root, text="Browse", command=self.select_input_folder,
-            corner_radius=self.button_corner_radius, fg_color=self.button_fg_color,
-            hover_color=self.button_hover_color, text_color=self.button_text_color,
-            border_width=self.button_border_width, width=100
-        )
-        self.browse_input_button.grid(row=0, column=2, padx=(5, 20), pady=10, sticky="e")
-
-        # --- Output Folder Selection ---
-        self.output_folder_label = ctk.CTkLabel(self.root, text="Save Grayscale To:")
-        self.output_folder_label.grid(row=1, column=0, padx=(20, 5), pady=10, sticky="w")
-
-        self.output_folder_entry = ctk.CTkEntry(self.root, placeholder_text="Path for processed images (optional, defaults to subfolder)")
-        self.output_folder_entry.grid(row=1, column=1, padx=5, pady=10, sticky="ew")
-
-        self.browse_output_button = ctk.CTkButton(
-            self.root, text="Browse", command=self.select_output_folder,
-            corner_radius=self.button_corner_radius, fg_color=self.button_fg_color,
-            hover_color=self.button_hover_color, text_color=self.button_text_color,
-             border_width=self.button_border_width, width=100
-        )
-        self.browse_output_button.grid(row=1, column=2, padx=(5, 20), pady=10, sticky="e")
-
-
-        # --- Control Buttons ---
-        controls_frame = ctk.CTkFrame(self.root, fg_color="transparent")
-        controls_frame.grid(row=2, column=0, columnspan=3, pady=10, padx=20, sticky="ew")
-        controls_frame.grid_columnconfigure((0,1), weight=1) # Distribute space
-
-        self.start_button = ctk.CTkButton(
-            controls_frame, text="Start Watching", command=self.start_watching,
-            corner_radius=self.button_corner_radius, fg_color=("green", "darkgreen"), # Specific color for start
-            hover_color=("#A9DFBF", "#58D68D"), text_color=self.button_text_color,
-            height=35, font=("Arial", 13, "bold")
-        )
-        self.start_button.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
-
-        self.stop_button = ctk.CTkButton(
-            controls_frame, text="Stop Watching", command=self.stop_watching, state="disabled",
-            corner_radius=self.button_corner_radius, fg_color=("red", "darkred"), # Specific color for stop
-            hover_color=("#F5B7B1", "#EC7063"), text_color=self.button_text_color,
-            height=35, font=("Arial", 13, "bold")
-        )
-        self.stop_button.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
-
-
-        # --- Log Display ---
-        self.log_label = ctk.CTkLabel(self.root, text="Activity Log:")
-        self.log_label.grid(row=3, column=0, padx=20, pady=(10,0), sticky="w")
-
-        self.log_text = ctk.CTkTextbox(self.root, state="disabled", height=150, wrap="word")
-        self.log_text.grid(row=4, column=0, columnspan=3, padx=20, pady=(0,10), sticky="nsew")
-        self.root.grid_rowconfigure(4, weight=1) 
-
-        # --- Status Label ---
-        self.status_label = ctk.CTkLabel(self.root, text="Status: Idle", text_color="gray", font=("Arial", 12, "italic"))
-        self.status_label.grid(row=5, column=0, columnspan=3, padx=20, pady=(5,10), sticky="w")
-
-        # --- Status Label ---
-        self.Creator_label = ctk.CTkLabel(self.root, text="Creator : Aby | Repo : github.com/abyshergill | License : Apache 2.0", text_color="gray", font=("Arial", 12, "bold"))
-        self.Creator_label.grid(row=6, column=0, columnspan=3, padx=20, pady=(5,10), sticky="w")
-
-
-    def select_input_folder(self):
-        folder_path = filedialog.askdirectory(title="Select Folder to Monitor")
-        if folder_path:
-            self.input_folder_entry.delete(0, ctk.END)
-            self.input_folder_entry.insert(0, folder_path)
-            self.add_log_message(f"Input folder selected: {folder_path}")
-
-    def select_output_folder(self):
-        folder_path = filedialog.askdirectory(title="Select Output Folder for Grayscale Images")
-        if folder_path:
-            self.output_folder_entry.delete(0, ctk.END)
-            self.output_folder_entry.insert(0, folder_path)
-            self.add_log_message(f"Output folder selected: {folder_path}")
-
-
-    def start_watching(self):
-        input_folder_path = self.input_folder_entry.get().strip()
-        output_folder_path = self.output_folder_entry.get().strip()
-
-        if not input_folder_path:
-            messagebox.showerror("Input Error", "Please select or enter an input folder path to monitor.")
-            self.add_log_message("Error: Input folder path is empty.")
-            return
-        if not os.path.exists(input_folder_path) or not os.path.isdir(input_folder_path):
-            messagebox.showerror("Input Error", f"The input folder path does not exist or is not a directory:\n{input_folder_path}")
-            self.add_log_message(f"Error: Invalid input folder path: {input_folder_path}")
-            return
-
-        if not output_folder_path:
-            output_folder_path = os.path.join(input_folder_path, "grayscale_output_default")
-            self.add_log_message(f"Output folder not specified. Defaulting to: {output_folder_path}")
-            self.output_folder_entry.delete(0, ctk.END) # Show default in entry
-            self.output_folder_entry.insert(0, output_folder_path)
-
-        # Try to create output folder if it doesn't exist to catch issues early
-        if not os.path.exists(output_folder_path):
-            try:
-                os.makedirs(output_folder_path)
-                self.add_log_message(f"Created output folder: {output_folder_path}")
-            except OSError as e:
-                messagebox.showerror("Output Error", f"Could not create output folder:\n{output_folder_path}\nError: {e}")
-                self.add_log_message(f"Error: Failed to create output folder {output_folder_path}: {e}")
-                return
-        elif not os.path.isdir(output_folder_path):
-             messagebox.showerror("Output Error", f"The specified output path exists but is not a directory:\n{output_folder_path}")
-             self.add_log_message(f"Error: Output path is not a directory: {output_folder_path}")
-             return
-
-
-        if self.is_watching:
-            self.add_log_message("Already watching. Please stop the current session first.")
-            return
-
-        self.image_processor = ImageProcessor(output_folder=output_folder_path)
-        self.watcher = FileWatcher(input_folder_path, self.image_processor, self.add_log_message) # Pass callback
-
-        self.watcher_thread = threading.Thread(target=self.watcher.watch, daemon=True)
-        self.watcher_thread.start()
-
-        self.is_watching = True
-        self.update_ui_for_watch_state(True, input_folder_path)
-        self.add_log_message(f"Started watching '{os.path.basename(input_folder_path)}'. Output to '{os.path.basename(output_folder_path)}'.")
-
-
-    def stop_watching(self):
-        if self.is_watching and self.watcher:
-            self.add_log_message("Stopping file watcher...")
-            self.watcher.stop()
-            if self.watcher_thread and self.watcher_thread.is_alive():
-                self.watcher_thread.join(timeout=5)
-                if self.watcher_thread.is_alive():
-                    self.add_log_message("Warning: Watcher thread did not terminate gracefully.")
-                    logging.warning("Watcher thread did not terminate in time.")
-
-            self.is_watching = False
-            self.update_ui_for_watch_state(False)
-            self.add_log_message("Stopped watching folder.")
-        else:
-            self.add_log_message("Not currently watching or watcher not initialized.")
-
-
-    def update_ui_for_watch_state(self, watching, folder_name=""):
-        if watching:
-            self.start_button.configure(state="disabled")
-            self.stop_button.configure(state="normal")
-            self.browse_input_button.configure(state="disabled")
-            self.input_folder_entry.configure(state="disabled")
-            self.browse_output_button.configure(state="disabled")
-            self.output_folder_entry.configure(state="disabled")
-            self.status_label.configure(text=f"Status: Watching '{os.path.basename(folder_name)}'...", text_color="green")
-        else:
-            self.start_button.configure(state="normal")
-            self.stop_button.configure(state="disabled")
-            self.browse_input_button.configure(state="normal")
-            self.input_folder_entry.configure(state="normal")
-            self.browse_output_button.configure(state="normal")
-            self.output_folder_entry.configure(state="normal")
-            self.status_label.configure(text="Status: Idle", text_color="gray")
-
-    def add_log_message(self, message):
-        """
-        Adds a message to the log queue for display and logs it to file.
-        This method is thread-safe for appending to deque and logging.
-        """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"{timestamp} - {message}"
-        self.log_queue.append(log_entry)
-        logging.info(message)
-
-    def update_log_display_periodically(self):
-        """
-        Periodically updates the log display with new entries.
-        Runs in the main Tkinter thread.
-        """
-        self.log_text.configure(state="normal")
-        # Efficiently add new messages instead of clearing and re-adding all
-        # For simplicity, this version still clears and re-adds.
-        # For very high log volume, consider only adding new lines.
-        current_log_content = self.log_text.get("1.0", ctk.END).strip()
-        new_log_entries = "\n".join(list(self.log_queue))
-
-        if current_log_content != new_log_entries: 
-            self.log_text.delete("1.0", ctk.END)
-            for log_entry in self.log_queue: 
-                self.log_text.insert(ctk.END, log_entry + "\n")
-            self.log_text.see(ctk.END) 
-        self.log_text.configure(state="disabled")
-
-        self.root.after(500, self.update_log_display_periodically) 
-
-
-    def on_closing(self):
-        """
-        Handles the window closing event.
-        """
-        if self.is_watching:
-            # Give a chance to confirm or stop gracefully
-            if messagebox.askyesno("Confirm Exit", "The file watcher is active. Are you sure you want to exit? This will stop the watcher."):
-                self.stop_watching()
-                self.root.destroy()
-            else:
-                return 
-        else:
-            self.root.destroy()
-
-if __name__ == "__main__":
-    ctk.set_appearance_mode("Light") # System, Dark, Light
-    ctk.set_default_color_theme("blue") # blue, dark-blue, green
-
-    app_root = ctk.CTk()
-    app = ImageProcessingApp(app_root)
-    app_root.protocol("WM_DELETE_WINDOW", app.on_closing)
+import os
+import customtkinter as ctk
+from tkinter import filedialog, messagebox 
+import threading
+import logging
+from datetime import datetime, timedelta, date
+
+
+#From utility Module
+from utility import FileWatcher 
+from utility import ImageProcessor
+from utility import LogBuffer
+from utility import PipelineMetrics
+from utility import Pipeline
+from utility import DedupCache
+from utility import WatchSource
+from utility import PER_FILE, setup_logging
+
+#--- Global Varibalbe for the logs directory----
+LOGS_DIRECTORY = "app_run_logs"
+#--- Session log: lowest level written ("FILE" adds a line per image, "INFO" skips them during steady ingest),
+#--- JSON lines instead of text, and rotation by size (or by time, e.g. "midnight", if LOG_ROTATE_WHEN is set)----
+LOG_LEVEL = "FILE"
+LOG_JSON_LINES = False
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_WHEN = None
+#--- Number of parallel conversion workers (cv2 releases the GIL, so threads scale across cores)----
+CONVERSION_WORKERS = os.cpu_count() or 1
+#--- Memory that images converted at the same time may use together; larger images wait for their turn----
+MEMORY_BUDGET_MB = 2048
+#--- Images above this many megapixels are decoded straight to grayscale (BMPs in strips) to save memory----
+LARGE_IMAGE_MEGAPIXELS = 50
+#--- Processed-file index kept in the output folder so restarts neither reprocess nor skip files----
+PROCESSED_INDEX_FILENAME = ".grayscaler_index.sqlite"
+#--- Cache of output files by source content, kept in the output folder when duplicate reuse is enabled----
+DEDUP_CACHE_FILENAME = ".grayscaler_dedup.sqlite"
+#--- Output format menu entries and the extension each one writes (None keeps the input format)----
+OUTPUT_FORMAT_CHOICES = {"Same as input": None, "JPEG": ".jpg", "PNG": ".png", "WebP": ".webp"}
+#--- Order in which images already waiting at startup are converted (new arrivals always go first)----
+BACKLOG_ORDER_CHOICES = {"Oldest first": "oldest", "Newest first": "newest", "Smallest first": "smallest"}
+#--- Separates several monitored folders in the Monitor Folder entry----
+INPUT_FOLDER_SEPARATOR = ";"
+#--- Subfolder of the monitored folder that originals are moved to when archiving is enabled----
+ARCHIVE_SUBFOLDER = "archived_originals"
+#--- Longest side, in pixels, of the thumbnails saved to a 'thumbnails' subfolder when enabled----
+THUMBNAIL_SIZE = 256
+#--- Activity log display: lines kept, refresh interval, and the slower interval used under heavy load----
+LOG_DISPLAY_LINES = 200
+LOG_REFRESH_MS = 500
+LOG_REFRESH_BUSY_MS = 1000
+#--- How often the status bar shows fresh throughput numbers while watching----
+STATUS_REFRESH_MS = 1000
+
+class ImageProcessingApp(object):
+    """
+    Main application class for the image processing and file watching GUI.
+    """
+    def __init__(self, root_window):
+        """
+        Initializes the main application window.
+        """
+        self.root = root_window
+        self.root.title("GrayScaler Converter")
+        self.root.geometry("750x690")
+        self.root.iconbitmap(r"icon\logo.ico")
+        self.root.minsize(700, 500)
+
+        self.setup_logging()
+        self.log_buffer = LogBuffer(maxlen=LOG_DISPLAY_LINES)
+        self.log_next_seq = 0 # Sequence number of the first log entry not yet shown
+        self.log_display_lines = 0
+
+        self.watcher_thread = None
+        self.is_watching = False
+        self.image_processor = None
+        self.watcher = None
+        self.metrics = None
+        self.status_text = "Status: Idle"
+
+        # --- Button Styling ---
+        self.button_corner_radius = 8
+        self.button_fg_color = ("#5DADE2", "#2E86C1")  
+        self.button_hover_color = ("#85C1E9", "#3498DB")
+        self.button_text_color = ("#FFFFFF", "#FFFFFF")
+        self.button_border_width = 0
+        self.button_border_spacing = 5
+
+        self.create_widgets()
+        self.update_log_display_periodically() 
+        self.update_status_periodically()
+	
+    def setup_logging(self):
+        """
+        Configures logging to create a new timestamped log file in a 'logs' directory
+        for each application run. Records are written by a background thread, so logging
+        never blocks the watcher or the conversion workers.
+        """
+        self.log_listener = None
+        try:
+            self.log_listener, log_filepath = setup_logging(
+                LOGS_DIRECTORY, logging.getLevelName(LOG_LEVEL), json_lines=LOG_JSON_LINES,
+                max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, rotate_when=LOG_ROTATE_WHEN)
+        except OSError as e:
+            print(f"CRITICAL: Could not create log file in '{LOGS_DIRECTORY}': {e}")
+            return
+
+        logging.info(f"Logging initialized. Log file: {log_filepath}")
+
+    def create_widgets(self):
+        """
+        Creates the UI elements.
+        """
+        self.root.grid_columnconfigure(1, weight=1) 
+
+        # --- Input Folder Selection ---
+        self.input_folder_label = ctk.CTkLabel(self.root, text="Monitor Folder:")
+        self.input_folder_label.grid(row=0, column=0, padx=(20, 5), pady=10, sticky="w")
+
+        self.input_folder_entry = ctk.CTkEntry(self.root, placeholder_text=f"Folder with original images (separate several with '{INPUT_FOLDER_SEPARATOR}')")
+        self.input_folder_entry.grid(row=0, column=1, padx=5, pady=10, sticky="ew")
+
+        self.browse_input_button = ctk.CTkButton(
+            self.root, text="Browse", command=self.select_input_folder,
+            corner_radius=self.button_corner_radius, fg_color=self.button_fg_color,
+            hover_color=self.button_hover_color, text_color=self.button_text_color,
+            border_width=self.button_border_width, width=100
+        )
+        self.browse_input_button.grid(row=0, column=2, padx=(5, 20), pady=10, sticky="e")
+
+        # --- Output Folder Selection ---
+        self.output_folder_label = ctk.CTkLabel(self.root, text="Save Grayscale To:")
+        self.output_folder_label.grid(row=1, column=0, padx=(20, 5), pady=10, sticky="w")
+
+        self.output_folder_entry = ctk.CTkEntry(self.root, placeholder_text="Path for processed images (optional, defaults to subfolder)")
+        self.output_folder_entry.grid(row=1, column=1, padx=5, pady=10, sticky="ew")
+
+        self.browse_output_button = ctk.CTkButton(
+            self.root, text="Browse", command=self.select_output_folder,
+            corner_radius=self.button_corner_radius, fg_color=self.button_fg_color,
+            hover_color=self.button_hover_color, text_color=self.button_text_color,
+             border_width=self.button_border_width, width=100
+        )
+        self.browse_output_button.grid(row=1, column=2, padx=(5, 20), pady=10, sticky="e")
+
+
+        # --- Output Encoding Options ---
+        self.output_format_label = ctk.CTkLabel(self.root, text="Output Format:")
+        self.output_format_label.grid(row=2, column=0, padx=(20, 5), pady=10, sticky="w")
+
+        encoding_frame = ctk.CTkFrame(self.root, fg_color="transparent")
+        encoding_frame.grid(row=2, column=1, columnspan=2, padx=(5, 20), pady=10, sticky="ew")
+
+        self.output_format_menu = ctk.CTkOptionMenu(encoding_frame, values=list(OUTPUT_FORMAT_CHOICES), width=140)
+        self.output_format_menu.grid(row=0, column=0, padx=(0, 15), sticky="w")
+
+        self.quality_label = ctk.CTkLabel(encoding_frame, text="JPEG/WebP Quality:")
+        self.quality_label.grid(row=0, column=1, padx=(0, 5), sticky="w")
+        self.quality_entry = ctk.CTkEntry(encoding_frame, placeholder_text="default", width=70)
+        self.quality_entry.grid(row=0, column=2, padx=(0, 15), sticky="w")
+
+        self.png_level_label = ctk.CTkLabel(encoding_frame, text="PNG Level:")
+        self.png_level_label.grid(row=0, column=3, padx=(0, 5), sticky="w")
+        self.png_level_menu = ctk.CTkOptionMenu(encoding_frame, values=["default"] + [str(i) for i in range(10)], width=90)
+        self.png_level_menu.grid(row=0, column=4, sticky="w")
+
+        # --- Watch Options ---
+        options_frame = ctk.CTkFrame(self.root, fg_color="transparent")
+        options_frame.grid(row=3, column=0, columnspan=3, padx=20, pady=(0, 5), sticky="ew")
+
+        self.recursive_checkbox = ctk.CTkCheckBox(options_frame, text="Watch subfolders (mirrored in the output folder)")
+        self.recursive_checkbox.grid(row=0, column=0, padx=(0, 20), sticky="w")
+
+        self.archive_originals_checkbox = ctk.CTkCheckBox(
+            options_frame, text=f"Move originals to an '{ARCHIVE_SUBFOLDER}' subfolder instead of deleting them")
+        self.archive_originals_checkbox.grid(row=0, column=1, sticky="w")
+
+        self.clahe_checkbox = ctk.CTkCheckBox(options_frame, text="Auto-contrast (CLAHE)")
+        self.clahe_checkbox.grid(row=1, column=0, padx=(0, 20), pady=(5, 0), sticky="w")
+
+        self.thumbnail_checkbox = ctk.CTkCheckBox(
+            options_frame, text=f"Also save {THUMBNAIL_SIZE} px thumbnails to a 'thumbnails' subfolder")
+        self.thumbnail_checkbox.grid(row=1, column=1, pady=(5, 0), sticky="w")
+
+        self.dedup_checkbox = ctk.CTkCheckBox(options_frame, text="Reuse outputs of duplicate images")
+        self.dedup_checkbox.grid(row=2, column=0, padx=(0, 20), pady=(5, 0), sticky="w")
+
+        backlog_frame = ctk.CTkFrame(options_frame, fg_color="transparent")
+        backlog_frame.grid(row=2, column=1, pady=(5, 0), sticky="w")
+        self.backlog_order_label = ctk.CTkLabel(backlog_frame, text="Waiting images at start:")
+        self.backlog_order_label.grid(row=0, column=0, padx=(0, 5), sticky="w")
+        self.backlog_order_menu = ctk.CTkOptionMenu(backlog_frame, values=list(BACKLOG_ORDER_CHOICES), width=140)
+        self.backlog_order_menu.grid(row=0, column=1, sticky="w")
+
+        # --- Control Buttons ---
+        controls_frame = ctk.CTkFrame(self.root, fg_color="transparent")
+        controls_frame.grid(row=4, column=0, columnspan=3, pady=10, padx=20, sticky="ew")
+        controls_frame.grid_columnconfigure((0,1), weight=1) # Distribute space
+
+        self.start_button = ctk.CTkButton(
+            controls_frame, text="Start Watching", command=self.start_watching,
+            corner_radius=self.button_corner_radius, fg_color=("green", "darkgreen"), # Specific color for start
+            hover_color=("#A9DFBF", "#58D68D"), text_color=self.button_text_color,
+            height=35, font=("Arial", 13, "bold")
+        )
+        self.start_button.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+
+        self.stop_button = ctk.CTkButton(
+            controls_frame, text="Stop Watching", command=self.stop_watching, state="disabled",
+            corner_radius=self.button_corner_radius, fg_color=("red", "darkred"), # Specific color for stop
+            hover_color=("#F5B7B1", "#EC7063"), text_color=self.button_text_color,
+            height=35, font=("Arial", 13, "bold")
+        )
+        self.stop_button.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+
+
+        # --- Log Display ---
+        self.log_label = ctk.CTkLabel(self.root, text="Activity Log:")
+        self.log_label.grid(row=5, column=0, padx=20, pady=(10,0), sticky="w")
+
+        self.log_text = ctk.CTkTextbox(self.root, state="disabled", height=150, wrap="word")
+        self.log_text.grid(row=6, column=0, columnspan=3, padx=20, pady=(0,10), sticky="nsew")
+        self.root.grid_rowconfigure(6, weight=1) 
+
+        # --- Status Label ---
+        self.status_label = ctk.CTkLabel(self.root, text="Status: Idle", text_color="gray", font=("Arial", 12, "italic"))
+        self.status_label.grid(row=7, column=0, columnspan=3, padx=20, pady=(5,10), sticky="w")
+
+        # --- Status Label ---
+        self.Creator_label = ctk.CTkLabel(self.root, text="Creator : Aby | Repo : github.com/abyshergill | License : Apache 2.0", text_color="gray", font=("Arial", 12, "bold"))
+        self.Creator_label.grid(row=8, column=0, columnspan=3, padx=20, pady=(5,10), sticky="w")
+
+
+    def select_input_folder(self):
+        folder_path = filedialog.askdirectory(title="Select Folder to Monitor")
+        if folder_path:
+            self.input_folder_entry.delete(0, ctk.END)
+            self.input_folder_entry.insert(0, folder_path)
+            self.add_log_message(f"Input folder selected: {folder_path}")
+
+    def select_output_folder(self):
+        folder_path = filedialog.askdirectory(title="Select Output Folder for Grayscale Images")
+        if folder_path:
+            self.output_folder_entry.delete(0, ctk.END)
+            self.output_folder_entry.insert(0, folder_path)
+            self.add_log_message(f"Output folder selected: {folder_path}")
+
+
+    def start_watching(self):
+        input_folder_paths = [path.strip() for path in self.input_folder_entry.get().split(INPUT_FOLDER_SEPARATOR) if path.strip()]
+        output_folder_path = self.output_folder_entry.get().strip()
+
+        if not input_folder_paths:
+            messagebox.showerror("Input Error", "Please select or enter an input folder path to monitor.")
+            self.add_log_message("Error: Input folder path is empty.")
+            return
+        for input_folder_path in input_folder_paths:
+            if not os.path.exists(input_folder_path) or not os.path.isdir(input_folder_path):
+                messagebox.showerror("Input Error", f"The input folder path does not exist or is not a directory:\n{input_folder_path}")
+                self.add_log_message(f"Error: Invalid input folder path: {input_folder_path}")
+                return
+        input_folder_path = input_folder_paths[0] # Default output and archive folders live in the first folder
+
+        if not output_folder_path:
+            output_folder_path = os.path.join(input_folder_path, "grayscale_output_default")
+            self.add_log_message(f"Output folder not specified. Defaulting to: {output_folder_path}")
+            self.output_folder_entry.delete(0, ctk.END) # Show default in entry
+            self.output_folder_entry.insert(0, output_folder_path)
+
+        # Try to create output folder if it doesn't exist to catch issues early
+        if not os.path.exists(output_folder_path):
+            try:
+                os.makedirs(output_folder_path)
+                self.add_log_message(f"Created output folder: {output_folder_path}")
+            except OSError as e:
+                messagebox.showerror("Output Error", f"Could not create output folder:\n{output_folder_path}\nError: {e}")
+                self.add_log_message(f"Error: Failed to create output folder {output_folder_path}: {e}")
+                return
+        elif not os.path.isdir(output_folder_path):
+             messagebox.showerror("Output Error", f"The specified output path exists but is not a directory:\n{output_folder_path}")
+             self.add_log_message(f"Error: Output path is not a directory: {output_folder_path}")
+             return
+
+
+        if self.is_watching:
+            self.add_log_message("Already watching. Please stop the current session first.")
+            return
+
+        quality_text = self.quality_entry.get().strip()
+        quality = None
+        if quality_text:
+            try:
+                quality = int(quality_text)
+                if not 1 <= quality <= 101:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Input Error", "Quality must be a whole number from 1 to 100 (101 for lossless WebP).")
+                self.add_log_message(f"Error: Invalid quality: {quality_text}")
+                return
+        png_level = self.png_level_menu.get()
+
+        self.metrics = PipelineMetrics()
+        self.image_processor = ImageProcessor(
+            output_folder=output_folder_path,
+            output_format=OUTPUT_FORMAT_CHOICES[self.output_format_menu.get()],
+            jpeg_quality=quality, webp_quality=quality,
+            png_compression=None if png_level == "default" else int(png_level),
+            archive_folder=os.path.join(input_folder_path, ARCHIVE_SUBFOLDER) if self.archive_originals_checkbox.get() else None,
+            # One decode feeds every output
+            pipeline=Pipeline.from_options(clahe=bool(self.clahe_checkbox.get()),
+                                           thumbnail=THUMBNAIL_SIZE if self.thumbnail_checkbox.get() else None),
+            dedup_cache=DedupCache(os.path.join(output_folder_path, DEDUP_CACHE_FILENAME)) if self.dedup_checkbox.get() else None,
+            large_image_pixels=LARGE_IMAGE_MEGAPIXELS * 1000000)
+        recursive = bool(self.recursive_checkbox.get())
+        sources = [WatchSource(path, recursive=recursive) for path in input_folder_paths]
+        self.watcher = FileWatcher(sources, self.image_processor, self.add_log_message, # Pass callback
+                                   workers=CONVERSION_WORKERS,
+                                   index_path=os.path.join(output_folder_path, PROCESSED_INDEX_FILENAME),
+                                   metrics=self.metrics,
+                                   memory_budget=MEMORY_BUDGET_MB * 1000000,
+                                   backlog_policy=BACKLOG_ORDER_CHOICES[self.backlog_order_menu.get()])
+
+        self.watcher_thread = threading.Thread(target=self.watcher.watch, daemon=True)
+        self.watcher_thread.start()
+
+        self.is_watching = True
+        folder_names = ", ".join(os.path.basename(os.path.abspath(path)) for path in input_folder_paths)
+        self.update_ui_for_watch_state(True, folder_names)
+        self.add_log_message(f"Started watching '{folder_names}'. Output to '{os.path.basename(output_folder_path)}'.")
+
+
+    def stop_watching(self):
+        if self.is_watching and self.watcher:
+            self.add_log_message("Stopping file watcher...")
+            self.watcher.stop()
+            if self.watcher_thread and self.watcher_thread.is_alive():
+                self.watcher_thread.join(timeout=5)
+                if self.watcher_thread.is_alive():
+                    self.add_log_message("Warning: Watcher thread did not terminate gracefully.")
+                    logging.warning("Watcher thread did not terminate in time.")
+
+            self.is_watching = False
+            self.update_ui_for_watch_state(False)
+            self.add_log_message("Stopped watching folder.")
+        else:
+            self.add_log_message("Not currently watching or watcher not initialized.")
+
+
+    def update_ui_for_watch_state(self, watching, folder_name=""):
+        if watching:
+            self.start_button.configure(state="disabled")
+            self.stop_button.configure(state="normal")
+            self.browse_input_button.configure(state="disabled")
+            self.input_folder_entry.configure(state="disabled")
+            self.browse_output_button.configure(state="disabled")
+            self.output_folder_entry.configure(state="disabled")
+            self.output_format_menu.configure(state="disabled")
+            self.quality_entry.configure(state="disabled")
+            self.png_level_menu.configure(state="disabled")
+            self.recursive_checkbox.configure(state="disabled")
+            self.clahe_checkbox.configure(state="disabled")
+            self.thumbnail_checkbox.configure(state="disabled")
+            self.dedup_checkbox.configure(state="disabled")
+            self.backlog_order_menu.configure(state="disabled")
+            self.archive_originals_checkbox.configure(state="disabled")
+            self.status_text = f"Status: Watching '{folder_name}'..."
+            self.status_label.configure(text=self.status_text, text_color="green")
+        else:
+            self.start_button.configure(state="normal")
+            self.stop_button.configure(state="disabled")
+            self.browse_input_button.configure(state="normal")
+            self.input_folder_entry.configure(state="normal")
+            self.browse_output_button.configure(state="normal")
+            self.output_folder_entry.configure(state="normal")
+            self.output_format_menu.configure(state="normal")
+            self.quality_entry.configure(state="normal")
+            self.png_level_menu.configure(state="normal")
+            self.recursive_checkbox.configure(state="normal")
+            self.clahe_checkbox.configure(state="normal")
+            self.thumbnail_checkbox.configure(state="normal")
+            self.dedup_checkbox.configure(state="normal")
+            self.backlog_order_menu.configure(state="normal")
+            self.archive_originals_checkbox.configure(state="normal")
+            self.status_text = "Status: Idle"
+            self.status_label.configure(text=self.status_text, text_color="gray")
+
+    def add_log_message(self, message, level=logging.INFO):
+        """
+        Adds a message to the log queue for display and logs it to file.
+        Per-image messages (level PER_FILE) repeat what the image processor already logged, so they
+        are only shown in the window. This method is thread-safe for appending to deque and logging.
+        """
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_entry = f"{timestamp} - {message}"
+        self.log_buffer.append(log_entry)
+        if level > PER_FILE:
+            logging.log(level, message)
+
+    def update_log_display_periodically(self):
+        """
+        Periodically appends new log entries to the display and trims the oldest lines.
+        Runs in the main Tkinter thread.
+        """
+        new_entries, self.log_next_seq = self.log_buffer.since(self.log_next_seq)
+        if new_entries:
+            self.log_text.configure(state="normal")
+            if len(new_entries) >= LOG_DISPLAY_LINES:
+                # The whole view is replaced anyway, so drop the old lines in one go
+                self.log_text.delete("1.0", ctk.END)
+                self.log_display_lines = 0
+            # One insert per refresh, however many entries arrived
+            self.log_text.insert(ctk.END, "\n".join(new_entries) + "\n")
+            self.log_display_lines += len(new_entries)
+            excess_lines = self.log_display_lines - LOG_DISPLAY_LINES
+            if excess_lines > 0:
+                self.log_text.delete("1.0", f"{excess_lines + 1}.0")
+                self.log_display_lines -= excess_lines
+            self.log_text.see(ctk.END)
+            self.log_text.configure(state="disabled")
+
+        # Under bursts, refresh less often so each refresh coalesces more entries
+        busy = len(new_entries) > LOG_DISPLAY_LINES // 2
+        self.root.after(LOG_REFRESH_BUSY_MS if busy else LOG_REFRESH_MS, self.update_log_display_periodically)
+
+
+    def update_status_periodically(self):
+        """
+        Shows live throughput, queue depth, failure counts and, while the startup backlog is draining,
+        its progress and estimated time left in the status bar while watching.
+        Runs in the main Tkinter thread.
+        """
+        if self.is_watching and self.metrics:
+            status = f"{self.status_text}  {self.metrics.summary_text()}"
+            if self.watcher and len(self.watcher.backlog):
+                status += f"  |  {self.watcher.backlog.progress_text()}"
+            self.status_label.configure(text=status)
+        self.root.after(STATUS_REFRESH_MS, self.update_status_periodically)
+
+    def on_closing(self):
+        """
+        Handles the window closing event.
+        """
+        if self.is_watching:
+            # Give a chance to confirm or stop gracefully
+            if messagebox.askyesno("Confirm Exit", "The file watcher is active. Are you sure you want to exit? This will stop the watcher."):
+                self.stop_watching()
+                self.root.destroy()
+            else:
+                return 
+        else:
+            self.root.destroy()
+        if self.log_listener:
+            self.log_listener.stop() # Writes out any records still queued
+
+if __name__ == "__main__":
+    ctk.set_appearance_mode("Light") # System, Dark, Light
+    ctk.set_default_color_theme("blue") # blue, dark-blue, green
+
+    app_root = ctk.CTk()
+    app = ImageProcessingApp(app_root)
+    app_root.protocol("WM_DELETE_WINDOW", app.on_closing)
     app_root.mainloop()
\ No newline at end of file
@@ -1,2 +1,8 @@
-from .filewatcher import FileWatcher
-from .imageprocessor import ImageProcessor
\ No newline at end of file
+from .dedupcache import DedupCache
+from .filewatcher import FileWatcher
+from .imageprocessor import ImageProcessor
+from .logbuffer import LogBuffer
+from .logsetup import PER_FILE, setup_logging
+from .metrics import PipelineMetrics
+from .pipeline import Pipeline
+from .watchsource import WatchSource
\ No newline at end of file
@@ -0,0 +1,115 @@
+# Priority queue for the files found in the watched folders at startup, with drain progress and ETA.
+
+import heapq
+import threading
+import time
+
+# Backlog orders: the stat field each sorts by, and whether larger values come first
+BACKLOG_POLICIES = {
+    "oldest": ("st_mtime_ns", False),
+    "newest": ("st_mtime_ns", True),
+    "smallest": ("st_size", False),
+}
+
+
+class Backlog:
+    """
+    Holds the files that were already waiting when the watcher started, ordered by a policy, so they
+    can be fed to the workers a few at a time while newly arriving files go first.
+    Also tracks how much of the backlog is done and estimates when it will be finished.
+    """
+    def __init__(self, policy="oldest"):
+        """
+        Initializes the Backlog.
+
+        Args:
+            policy (str): 'oldest' or 'newest' (by modification time) or 'smallest' (by size) first.
+                Defaults to 'oldest'.
+        """
+        if policy not in BACKLOG_POLICIES:
+            raise ValueError(f"policy must be one of {sorted(BACKLOG_POLICIES)}, got {policy}")
+        self.policy = policy
+        self.total = 0
+        self.completed = 0
+        self._heap = []
+        self._in_flight = set() # Paths popped but not yet finished
+        self._started = None # time.monotonic() when the first file was handed out
+        self._lock = threading.Lock()
+
+    def extend(self, items, stats):
+        """
+        Adds files found by the startup scan.
+
+        Args:
+            items (list): (source, path) pairs.
+            stats (dict): path -> os.stat_result from the scan; files without one sort last.
+        """
+        field, descending = BACKLOG_POLICIES[self.policy]
+        entries = []
+        for source, path in items:
+            st = stats.get(path)
+            value = getattr(st, field) if st is not None else None
+            if value is None:
+                key = float("inf")
+            else:
+                key = -value if descending else value
+            entries.append((key, len(self._heap) + len(entries), path, source))
+        with self._lock:
+            self._heap.extend(entries)
+            heapq.heapify(self._heap) # One O(n) heapify instead of n pushes
+            self.total += len(entries)
+
+    def pop(self):
+        """
+        Returns:
+            tuple: (source, path) of the next file in policy order, or None if the backlog is empty.
+        """
+        with self._lock:
+            if not self._heap:
+                return None
+            _, _, path, source = heapq.heappop(self._heap)
+            self._in_flight.add(path)
+            if self._started is None:
+                self._started = time.monotonic()
+            return source, path
+
+    def mark_done(self, path):
+        """Counts a backlog file as finished (converted, dead-lettered or gone). Other paths are ignored."""
+        with self._lock:
+            if path in self._in_flight:
+                self._in_flight.discard(path)
+                self.completed += 1
+
+    def __len__(self):
+        """Files not yet finished: still queued or handed out."""
+        return len(self._heap) + len(self._in_flight)
+
+    @property
+    def queued(self):
+        """Files not yet handed out."""
+        return len(self._heap)
+
+    def progress(self):
+        """
+        Returns:
+            dict: 'total', 'completed', 'remaining' and 'eta_seconds' (None until there is a rate to go by).
+        """
+        with self._lock:
+            remaining = len(self._heap) + len(self._in_flight)
+            elapsed = time.monotonic() - self._started if self._started is not None else 0
+            rate = self.completed / elapsed if self.completed and elapsed > 0 else None
+            return {"total": self.total, "completed": self.completed, "remaining": remaining,
+                    "eta_seconds": remaining / rate if rate else None}
+
+    def progress_text(self):
+        """Short progress line for a status bar, e.g. 'backlog 1200/5000 (24%), ~3m 20s left'."""
+        progress = self.progress()
+        if not progress["total"]:
+            return ""
+        text = (f"backlog {progress['completed']}/{progress['total']} "
+                f"({100 * progress['completed'] // progress['total']}%)")
+        if progress["eta_seconds"] is not None:
+            minutes, seconds = divmod(int(progress["eta_seconds"]), 60)
+            hours, minutes = divmod(minutes, 60)
+            text += f", ~{hours}h {minutes}m left" if hours else f", ~{minutes}m {seconds}s left"
+        return text
@@ -0,0 +1,177 @@
+# Claim protocol that lets several watcher nodes share one input folder (e.g. on NFS) without converting
+# the same file twice: a node takes a file by atomically renaming it into its own claim folder.
+
+import errno
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+
+from .fileops import atomic_write, move_to_folder
+
+# Created in every watched root; claims must live on the same file system as the files for rename to be atomic
+CLAIMS_FOLDER_NAME = ".grayscaler_claims"
+# Heartbeat file of each node, next to its claim folder
+HEARTBEAT_SUFFIX = ".alive"
+# Appended to the claim folder of a dead node while its files are being moved back
+RECLAIM_MARKER = ".reclaimed-by-"
+
+
+def default_node_id():
+    """Host name plus process id, so nodes on one machine (and a restarted node) never share a claim folder."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ClaimManager:
+    """
+    Coordinates nodes sharing watched folders. A node claims a file by renaming it into
+    <root>/.grayscaler_claims/<node id>/, which only one node can do, and converts it from there.
+    Every node rewrites its <node id>.alive file with a counter while running. A node whose counter
+    has not changed for lease_seconds, as measured on the observing node's own clock (so clock skew
+    between hosts does not matter), is considered dead, and its claimed files are moved back into the
+    watched folder for the surviving nodes to pick up.
+    """
+    def __init__(self, roots, node_id=None, lease_seconds=30):
+        """
+        Initializes the ClaimManager.
+
+        Args:
+            roots (list): Watched root folders. Each gets its own claim folder.
+            node_id (str): Name of this node, unique among the nodes sharing the folders.
+                Defaults to default_node_id().
+            lease_seconds (float): How long a node's heartbeat may stay unchanged before its claims
+                are taken back. Defaults to 30.
+        """
+        if node_id and (os.sep in node_id or RECLAIM_MARKER in node_id or node_id.startswith(".")):
+            raise ValueError(f"Invalid node id: {node_id}")
+        self.node_id = node_id or default_node_id()
+        self.lease_seconds = lease_seconds
+        self.claim_folders = {os.path.abspath(root): os.path.join(os.path.abspath(root), CLAIMS_FOLDER_NAME)
+                              for root in roots}
+        self._beat = 0
+        self._observed = {} # (claims folder, node id) -> (heartbeat contents, time.monotonic() it was first seen)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Takes back claims left by an earlier run under the same node id, then starts the heartbeat thread."""
+        for claims in self.claim_folders.values():
+            os.makedirs(os.path.join(claims, self.node_id), exist_ok=True)
+            self._restore_folder(claims, os.path.join(claims, self.node_id))
+        self._heartbeat()
+        self._thread = threading.Thread(target=self._run, name="claims-heartbeat", daemon=True)
+        self._thread.start()
+        logging.info(f"Claims enabled as node {self.node_id} (lease {self.lease_seconds:g}s)")
+
+    def stop(self):
+        """Stops the heartbeat and hands every file still claimed back to the other nodes."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for claims in self.claim_folders.values():
+            restored = self._restore_folder(claims, os.path.join(claims, self.node_id))
+            if restored:
+                logging.info(f"Released {restored} unprocessed claims in {claims}")
+            try:
+                os.remove(os.path.join(claims, self.node_id + HEARTBEAT_SUFFIX))
+                os.rmdir(os.path.join(claims, self.node_id))
+            except OSError:
+                pass
+
+    def claim(self, root, path):
+        """
+        Takes a file for this node.
+
+        Args:
+            root (str): Watched root the file was found in.
+            path (str): Path to the file.
+
+        Returns:
+            str: Path of the claimed file to convert, or None if another node claimed it first.
+        """
+        claims = self.claim_folders[os.path.abspath(root)]
+        claimed = os.path.join(claims, self.node_id, os.path.relpath(path, os.path.abspath(root)))
+        os.makedirs(os.path.dirname(claimed), exist_ok=True)
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None # Claimed (or removed) by someone else
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            logging.warning(f"{path} is on another file system than {claims}; converting it unclaimed")
+            return path
+        return claimed
+
+    def _run(self):
+        interval = max(0.1, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                self._heartbeat()
+                self._reclaim_expired()
+            except Exception as e:
+                logging.error(f"Claim heartbeat failed: {e}")
+
+    def _heartbeat(self):
+        self._beat += 1
+        for claims in self.claim_folders.values():
+            os.makedirs(os.path.join(claims, self.node_id), exist_ok=True)
+            atomic_write(os.path.join(claims, self.node_id + HEARTBEAT_SUFFIX), f"{self._beat}\n".encode())
+
+    def _reclaim_expired(self):
+        """Moves the claims of nodes whose heartbeat stopped changing back into the watched folders."""
+        now = time.monotonic()
+        for claims in self.claim_folders.values():
+            try:
+                with os.scandir(claims) as entries:
+                    folders = [entry.name for entry in entries if entry.is_dir()]
+            except FileNotFoundError:
+                continue
+            for name in folders:
+                owner = name.rsplit(RECLAIM_MARKER, 1)[-1]
+                if owner == self.node_id:
+                    continue
+                try:
+                    with open(os.path.join(claims, owner + HEARTBEAT_SUFFIX), "rb") as f:
+                        beat = f.read()
+                except FileNotFoundError:
+                    beat = None
+                observed = self._observed.get((claims, owner))
+                if observed is None or observed[0] != beat:
+                    self._observed[(claims, owner)] = (beat, now)
+                    continue
+                if now - observed[1] < self.lease_seconds:
+                    continue
+                # Renaming the folder first makes sure only one surviving node moves its files back
+                taken = os.path.join(claims, name + RECLAIM_MARKER + self.node_id)
+                try:
+                    os.rename(os.path.join(claims, name), taken)
+                except FileNotFoundError:
+                    continue
+                restored = self._restore_folder(claims, taken)
+                shutil.rmtree(taken, ignore_errors=True)
+                if owner == name:
+                    try:
+                        os.remove(os.path.join(claims, owner + HEARTBEAT_SUFFIX))
+                    except FileNotFoundError:
+                        pass
+                self._observed.pop((claims, owner), None)
+                logging.warning(f"Node {owner} stopped responding; returned its {restored} claimed files from {claims}")
+
+    def _restore_folder(self, claims, folder):
+        """Moves every file in a claim folder back to the same place under the watched root."""
+        root = os.path.dirname(claims)
+        restored = 0
+        for current, _, files in os.walk(folder, topdown=False):
+            relative = os.path.relpath(current, folder)
+            for name in files:
+                move_to_folder(os.path.join(current, name), os.path.normpath(os.path.join(root, relative)))
+                restored += 1
+            if current != folder:
+                try:
+                    os.rmdir(current)
+                except OSError:
+                    pass
+        return restored
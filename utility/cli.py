@@ -0,0 +1,417 @@
+# Headless command-line interface: one-shot conversion of a directory tree, or continuous watching.
+# Imports neither tkinter nor customtkinter, so it runs on servers and starts quickly.
+
+import argparse
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+from .backlog import BACKLOG_POLICIES
+from .dedupcache import DedupCache
+from .dirwatch import is_image_file
+from .fileops import remove_stale_temp_files
+from .filewatcher import FileWatcher
+from .imageprocessor import ImageProcessor
+from .logsetup import PER_FILE, parse_level, setup_logging
+from .metrics import MetricsExporter, PipelineMetrics
+from .pipeline import Pipeline
+from .watchsource import WatchSource
+from .workerpool import WorkerPool, process_image
+
+# Lowest level of the watcher messages printed to stdout; -v lowers it to include the per-image lines
+console_level = logging.INFO
+# Lowest level the logging system itself writes to stderr; -v lowers it to include the per-image lines
+stderr_level = logging.WARNING
+
+
+def find_images(input_folder, recursive=False, exclude_folder=None):
+    """
+    Lists the image files under a folder with os.scandir.
+
+    Args:
+        input_folder (str): Folder to search.
+        recursive (bool): Descend into subfolders. Defaults to False.
+        exclude_folder (callable): Called with the path of each subfolder; subfolders it returns True for are
+            skipped, e.g. output folders nested inside the input. Defaults to None (no subfolder is skipped).
+
+    Yields:
+        tuple: (path of the image, folder relative to input_folder).
+    """
+    pending = [input_folder]
+    while pending:
+        folder = pending.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not (exclude_folder and exclude_folder(entry.path)):
+                        pending.append(entry.path)
+                elif is_image_file(entry.name) and entry.is_file():
+                    yield entry.path, os.path.relpath(folder, input_folder)
+
+
+def output_folder_filter(args, output_folder, pipeline):
+    """
+    Builds a predicate telling which folders a conversion writes to, so a recursive scan skips its own outputs.
+
+    Args:
+        args (argparse.Namespace): Parsed 'convert' arguments.
+        output_folder (str): The processor's output folder.
+        pipeline (Pipeline): The processor's pipeline, whose output subfolders are excluded too.
+
+    Returns:
+        callable: Takes a folder path and returns True if outputs or archived originals are written there.
+    """
+    excluded = {os.path.abspath(output_folder)}
+    if args.archive:
+        excluded.add(os.path.abspath(args.archive))
+    subfolders = {os.path.normpath(output.subfolder) for output in pipeline.outputs if output.subfolder}
+    excluded.update(os.path.abspath(os.path.join(output_folder, subfolder)) for subfolder in subfolders)
+    # Mirrored outputs get their own subfolders, e.g. <output>/<relative folder>/thumbnails. These are only
+    # outside the excluded output folder when the output folder is the input folder itself.
+    mirrored_into_input = args.layout == "mirror" and os.path.abspath(output_folder) == os.path.abspath(args.input)
+
+    def is_output_folder(folder):
+        folder = os.path.abspath(folder)
+        if folder in excluded:
+            return True
+        return mirrored_into_input and any(folder.endswith(os.sep + subfolder) for subfolder in subfolders)
+
+    return is_output_folder
+
+
+def run_convert(args):
+    """
+    Converts every image under the input folder once, using a worker pool.
+
+    Returns:
+        int: Process exit code, 1 if any image failed.
+    """
+    if not os.path.isdir(args.input):
+        logging.error(f"Input folder does not exist or is not a directory: {args.input}")
+        return 2
+    output_folder = args.output or os.path.join(args.input, "grayscale_output_default")
+    try:
+        image_processor = make_processor(args, output_folder)
+    except (OSError, ValueError) as e:
+        logging.error(f"Invalid processing options: {e}")
+        return 2
+    remove_stale_temp_files(output_folder) # Left behind by an earlier run that was killed mid-write
+    results = {"converted": 0, "failed": 0, "bytes_written": 0, "encode_seconds": 0.0, "hit": 0, "miss": 0}
+    results_lock = threading.Lock()
+
+    def on_done(image_path, future):
+        try:
+            gray_path, stats = future.result()
+        except Exception as e:
+            logging.error(f"Worker failed on {image_path}: {e}")
+            gray_path, stats = None, {}
+        if metrics is not None:
+            if gray_path:
+                metrics.record_success(stats)
+            else:
+                metrics.increment("files_failed")
+        with results_lock:
+            results["converted" if gray_path else "failed"] += 1
+            results["bytes_written"] += stats.get("bytes_written", 0)
+            results["encode_seconds"] += stats.get("encode_seconds", 0.0)
+            if "dedup" in stats:
+                results[stats["dedup"]] += 1
+        if not gray_path:
+            log_to_console(f"Failed to process: {image_path}")
+
+    metrics, exporter = start_metrics(args)
+    pool = WorkerPool(args.workers, args.processes, memory_budget=memory_budget_bytes(args))
+    if metrics is not None:
+        metrics.set_gauge("queue_depth", lambda: pool.pending)
+    started = time.monotonic()
+    is_output_folder = output_folder_filter(args, output_folder, image_processor.pipeline)
+    for image_path, relative_folder in find_images(args.input, args.recursive, exclude_folder=is_output_folder):
+        if args.layout == "mirror" and relative_folder != os.curdir:
+            target_folder = os.path.join(output_folder, relative_folder)
+        else:
+            target_folder = output_folder
+        cost = image_processor.estimate_memory(image_path) if args.memory_budget else 0
+        pool.submit(lambda future, path=image_path: on_done(path, future),
+                    process_image, image_processor, image_path, os.path.basename(image_path),
+                    args.delete_originals or bool(args.archive), target_folder, cost=cost)
+    pool.shutdown(cancel_pending=False)
+    if exporter is not None:
+        exporter.stop()
+
+    elapsed = time.monotonic() - started
+    total = results["converted"] + results["failed"]
+    rate = total / elapsed if elapsed > 0 else 0.0
+    log_to_console(f"Converted {results['converted']} of {total} images in {elapsed:.1f}s ({rate:.1f} images/s).")
+    if results["converted"]:
+        mean_encode_ms = 1000 * results["encode_seconds"] / results["converted"]
+        log_to_console(f"Wrote {results['bytes_written'] / 1e6:.1f} MB, "
+                       f"{results['bytes_written'] / results['converted'] / 1e3:.1f} KB and "
+                       f"{mean_encode_ms:.1f} ms encode time per image.")
+    if results["hit"] or results["miss"]:
+        log_to_console(f"Dedup cache: {results['hit']} hits, {results['miss']} misses "
+                       f"({100 * results['hit'] / (results['hit'] + results['miss']):.1f}% hit rate).")
+    return 1 if results["failed"] else 0
+
+
+def run_watch(args):
+    """
+    Watches the input folders until interrupted with Ctrl+C or stopped with SIGTERM.
+
+    Returns:
+        int: Process exit code.
+    """
+    try:
+        sources = load_sources(args)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error(f"Could not read sources file {args.sources}: {e}")
+        return 2
+    if not sources:
+        logging.error("No input folders given; pass folders or --sources FILE.")
+        return 2
+    for source in sources:
+        if not os.path.isdir(source.root):
+            logging.error(f"Input folder does not exist or is not a directory: {source.root}")
+            return 2
+    output_folder = args.output or os.path.join(sources[0].root, "grayscale_output_default")
+    index_path = args.index or os.path.join(output_folder, ".grayscaler_index.sqlite")
+    try:
+        image_processor = make_processor(args, output_folder)
+    except (OSError, ValueError) as e:
+        logging.error(f"Invalid processing options: {e}")
+        return 2
+    metrics, exporter = start_metrics(args)
+    watcher = FileWatcher(sources, image_processor, log_to_console, update_interval=args.interval,
+                          workers=args.workers, use_processes=args.processes,
+                          use_inotify=not args.poll, index_path=index_path, metrics=metrics,
+                          memory_budget=memory_budget_bytes(args), backlog_policy=args.backlog_order,
+                          claim_files=args.shared, node_id=args.node_id, claim_lease=args.claim_lease)
+    watcher_thread = threading.Thread(target=watcher.watch, daemon=True)
+    watcher_thread.start()
+    # Service managers stop with SIGTERM; shut down cleanly so claimed files are handed back
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        while watcher_thread.is_alive():
+            watcher_thread.join(0.5)
+    except KeyboardInterrupt:
+        log_to_console("Interrupted, stopping file watcher...")
+        watcher.stop()
+        watcher_thread.join()
+    if exporter is not None:
+        exporter.stop()
+    return 0
+
+
+def load_sources(args):
+    """
+    Builds the WatchSource list from the positional folders and the --sources file.
+
+    The sources file is a JSON list of objects with 'root' and optionally 'output', 'recursive',
+    'include' and 'exclude', e.g. [{"root": "/data/cam1", "output": "/data/gray/cam1", "recursive": true}].
+
+    Returns:
+        list: WatchSource objects.
+    """
+    sources = [WatchSource(folder, recursive=args.recursive, include=args.include, exclude=args.exclude)
+               for folder in args.inputs]
+    if args.sources:
+        with open(args.sources) as f:
+            sources.extend(WatchSource.from_config(entry) for entry in json.load(f))
+    return sources
+
+
+def memory_budget_bytes(args):
+    """Converts --memory-budget from MB to bytes (None when not given)."""
+    return int(args.memory_budget * 1e6) if args.memory_budget else None
+
+
+def start_metrics(args):
+    """
+    Creates metrics and starts their exporter if --metrics-file or --metrics-port was given.
+
+    Returns:
+        tuple: (PipelineMetrics, MetricsExporter), or (None, None) when metrics are disabled.
+    """
+    if not args.metrics_file and not args.metrics_port:
+        return None, None
+    metrics = PipelineMetrics()
+    exporter = MetricsExporter(metrics, textfile_path=args.metrics_file, port=args.metrics_port)
+    exporter.start()
+    return metrics, exporter
+
+
+def make_processor(args, output_folder):
+    """Creates an ImageProcessor configured from the command-line options."""
+    if args.pipeline:
+        pipeline = Pipeline.from_file(args.pipeline)
+    else:
+        pipeline = Pipeline.from_options(resize=args.resize, clahe=args.clahe, thumbnail=args.thumbnail)
+    dedup_cache = None
+    if args.dedup or args.dedup_cache:
+        dedup_cache = DedupCache(args.dedup_cache or os.path.join(output_folder, ".grayscaler_dedup.sqlite"),
+                                 args.dedup_max_entries)
+    return ImageProcessor(output_folder=output_folder, fast_decode=not args.full_decode,
+                          reduce_factor=args.reduce, output_format=args.format,
+                          jpeg_quality=args.jpeg_quality, jpeg_progressive=args.jpeg_progressive,
+                          jpeg_optimize=args.jpeg_optimize, png_compression=args.png_compression,
+                          webp_quality=args.webp_quality, archive_folder=args.archive, pipeline=pipeline,
+                          dedup_cache=dedup_cache,
+                          large_image_pixels=int(args.large_image_mp * 1e6) if args.large_image_mp else None)
+
+
+def parse_size(value):
+    """Parses 'WIDTHxHEIGHT', 'WIDTHx' or 'xHEIGHT' into a (width, height) tuple with None for a missing side."""
+    width, separator, height = value.lower().partition("x")
+    try:
+        size = (int(width) if width else None, int(height) if height else None)
+    except ValueError:
+        size = None
+    if not separator or not size or not any(size) or any(side is not None and side <= 0 for side in size):
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, WIDTHx or xHEIGHT, got {value!r}")
+    return size
+
+
+def log_to_console(message, level=logging.INFO):
+    """
+    Prints a timestamped message, mirroring the GUI activity log. Per-image messages are only printed with -v.
+    Like the GUI, everything above PER_FILE also goes to the log file; messages the logging system
+    already writes to stderr are not printed a second time.
+    """
+    if level > PER_FILE:
+        logging.log(level, message)
+        if level >= stderr_level:
+            return
+    if level < console_level:
+        return
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"{timestamp} - {message}", flush=True)
+
+
+def logging_options(with_defaults=True):
+    """
+    Parent parser with the -v and --log-* options, accepted both before and after the subcommand.
+
+    Args:
+        with_defaults (bool): Fill in defaults for options that are not given. The subcommands' copy
+            leaves them out, so it does not overwrite options given before the subcommand.
+    """
+    options = argparse.ArgumentParser(add_help=False, argument_default=None if with_defaults else argparse.SUPPRESS)
+    options.add_argument("-v", "--verbose", action="store_true", help="Show per-image log messages.")
+    options.add_argument("--log-dir", help="Also write a rotating log file to this folder.")
+    options.add_argument("--log-level", type=parse_level,
+                         help="Lowest level written to the log file: FILE includes a line per image (default: INFO).")
+    options.add_argument("--log-json", action="store_true", help="Write the log file as JSON lines.")
+    options.add_argument("--log-max-mb", type=float,
+                         help="Start a new log file at this size; 5 old files are kept (default: 10).")
+    if with_defaults:
+        options.set_defaults(log_level=logging.INFO, log_max_mb=10)
+    return options
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="grayscaler", description="Convert images to grayscale without the GUI.",
+                                     parents=[logging_options()])
+    subcommand_options = logging_options(with_defaults=False)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(subparser):
+        subparser.add_argument("-o", "--output", help="Folder for grayscale images (defaults to a subfolder of the input).")
+        subparser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                               help="Number of conversion workers (default: number of CPU cores).")
+        subparser.add_argument("--processes", action="store_true", help="Use worker processes instead of threads.")
+        subparser.add_argument("--metrics-file", metavar="PATH",
+                               help="Keep Prometheus metrics in this text file (rewritten every 5 seconds).")
+        subparser.add_argument("--metrics-port", type=int, metavar="PORT",
+                               help="Serve metrics on http://127.0.0.1:PORT/metrics and /metrics.json.")
+        subparser.add_argument("--reduce", type=int, choices=(1, 2, 4, 8), default=1,
+                               help="Downscale outputs by this factor while decoding (default: 1).")
+        subparser.add_argument("--full-decode", action="store_true",
+                               help="Decode full color and convert, instead of decoding straight to grayscale.")
+        subparser.add_argument("--format", choices=("jpg", "png", "webp", "bmp"),
+                               help="Transcode outputs to this format (default: keep the input format).")
+        subparser.add_argument("--jpeg-quality", type=int, help="JPEG quality 0-100 (default: 95).")
+        subparser.add_argument("--jpeg-progressive", action="store_true", help="Write progressive JPEGs.")
+        subparser.add_argument("--jpeg-optimize", action="store_true",
+                               help="Optimize JPEG Huffman tables: smaller files, slower encode.")
+        subparser.add_argument("--png-compression", type=int, choices=range(10), metavar="0-9",
+                               help="PNG compression level: 0 is fastest, 9 is smallest.")
+        subparser.add_argument("--archive", metavar="FOLDER",
+                               help="Move originals to this folder after conversion instead of deleting them.")
+        subparser.add_argument("--webp-quality", type=int,
+                               help="WebP quality 1-100; above 100 is lossless (default: lossless).")
+        subparser.add_argument("--clahe", action="store_true", help="Apply CLAHE auto-contrast to every output.")
+        subparser.add_argument("--resize", type=parse_size, metavar="WxH",
+                               help="Resize the main output, e.g. 1920x1080, 1920x or x1080 (keeps the aspect ratio).")
+        subparser.add_argument("--thumbnail", type=int, metavar="PIXELS",
+                               help="Also save thumbnails fitting in PIXELS x PIXELS to a 'thumbnails' subfolder.")
+        subparser.add_argument("--pipeline", metavar="FILE",
+                               help="JSON file describing the processing stages and outputs "
+                                    "(overrides --clahe, --resize and --thumbnail).")
+        subparser.add_argument("--memory-budget", type=float, metavar="MB",
+                               help="Convert only as many images at once as fit in this much memory, estimated "
+                                    "from their headers; larger images wait for their turn (default: no limit).")
+        subparser.add_argument("--large-image-mp", type=float, default=50, metavar="MEGAPIXELS",
+                               help="Decode images above this size straight to grayscale, converting BMPs in strips, "
+                                    "to save memory; 0 disables (default: 50).")
+        subparser.add_argument("--dedup", action="store_true",
+                               help="Hard-link (or copy) the earlier output for images with identical contents "
+                                    "instead of converting them again.")
+        subparser.add_argument("--dedup-cache", metavar="PATH",
+                               help="Dedup cache file, implies --dedup (default: .grayscaler_dedup.sqlite in the output folder).")
+        subparser.add_argument("--dedup-max-entries", type=int, default=10000, metavar="N",
+                               help="Images remembered by the dedup cache before the least recently used are dropped "
+                                    "(default: 10000).")
+
+    convert_parser = subparsers.add_parser("convert", help="Convert every image in a folder once and exit.",
+                                           parents=[subcommand_options])
+    convert_parser.add_argument("input", help="Folder with the original images.")
+    add_common(convert_parser)
+    convert_parser.add_argument("-r", "--recursive", action="store_true", help="Include subfolders.")
+    convert_parser.add_argument("--layout", choices=("flat", "mirror"), default="flat",
+                                help="Put all outputs in one folder, or mirror the input subfolders (default: flat).")
+    convert_parser.add_argument("--delete-originals", action="store_true",
+                                help="Delete each original after it was converted successfully.")
+    convert_parser.set_defaults(func=run_convert)
+
+    watch_parser = subparsers.add_parser("watch", help="Watch folders, converting and deleting new images until Ctrl+C.",
+                                         parents=[subcommand_options])
+    watch_parser.add_argument("inputs", nargs="*", metavar="input", help="Folders with the original images.")
+    add_common(watch_parser)
+    watch_parser.add_argument("-r", "--recursive", action="store_true",
+                              help="Also watch subfolders, mirroring them in the output folder.")
+    watch_parser.add_argument("--include", action="append", metavar="GLOB",
+                              help="Only process files matching this glob, e.g. '*.jpg' or 'cam1/*' (repeatable).")
+    watch_parser.add_argument("--exclude", action="append", metavar="GLOB",
+                              help="Skip files and subfolders matching this glob (repeatable).")
+    watch_parser.add_argument("--sources", metavar="FILE",
+                              help="JSON list of extra folders to watch, each with its own output, recursion and globs.")
+    watch_parser.add_argument("--interval", type=float, default=1, help="Polling interval in seconds (default: 1).")
+    watch_parser.add_argument("--poll", action="store_true", help="Poll the folder even when inotify is available.")
+    watch_parser.add_argument("--index", help="Processed-file index (default: .grayscaler_index.sqlite in the output folder).")
+    watch_parser.add_argument("--backlog-order", choices=sorted(BACKLOG_POLICIES), default="oldest",
+                              help="Order for images already waiting at startup (default: oldest). "
+                                   "New arrivals always go first.")
+    watch_parser.add_argument("--shared", action="store_true",
+                              help="Claim files before converting them, so several watchers can share the input folders.")
+    watch_parser.add_argument("--node-id", help="Name of this watcher with --shared (default: host name and process id).")
+    watch_parser.add_argument("--claim-lease", type=float, default=30,
+                              help="Seconds after which a silent watcher's claimed files are taken back (default: 30).")
+    watch_parser.set_defaults(func=run_watch)
+    return parser
+
+
+def main(argv=None):
+    global console_level, stderr_level
+    args = build_parser().parse_args(argv)
+    console_level = PER_FILE if args.verbose else logging.INFO
+    stderr_level = PER_FILE if args.verbose else logging.WARNING
+    listener, _ = setup_logging(args.log_dir, args.log_level, json_lines=args.log_json,
+                                max_bytes=int(args.log_max_mb * 1024 * 1024),
+                                console_level=stderr_level, file_prefix="cli_session")
+    try:
+        return args.func(args)
+    finally:
+        listener.stop()
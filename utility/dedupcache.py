@@ -0,0 +1,168 @@
+# Content-addressed cache of outputs, so identical images delivered under new names are not converted again.
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Hash used for cache keys: xxh3-128 if the xxhash package is installed, otherwise BLAKE2b (standard library)
+HASH_NAME = "xxh3_128" if xxhash is not None else "blake2b_128"
+
+# The watcher logs the hit/miss totals after every this many lookups
+STATS_LOG_INTERVAL = 100
+
+# (process id, cache token) -> (connection, lock). Worker processes receive a pickled copy of the cache
+# with every job, so the copies share one connection per process instead of reopening the database.
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _connect(token, cache_path):
+    """Returns this process's (connection, lock) for a cache, opening the database on first use."""
+    key = (os.getpid(), token)
+    with _connections_lock:
+        if key not in _connections:
+            # Several worker processes may write to the same file, so wait for their locks instead of failing
+            conn = sqlite3.connect(cache_path or ":memory:", timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dedup ("
+                " key TEXT NOT NULL PRIMARY KEY, outputs TEXT NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID")
+            conn.execute("CREATE INDEX IF NOT EXISTS dedup_last_used ON dedup (last_used)")
+            conn.commit()
+            _connections[key] = (conn, threading.Lock())
+        return _connections[key]
+
+
+def content_hash(path):
+    """
+    Hashes a file's contents through a memory map, so the bytes are never copied into Python.
+
+    Args:
+        path (str): File to hash.
+
+    Returns:
+        str: Hex digest prefixed with the hash name, e.g. 'blake2b_128:4f1c...'.
+    """
+    hasher = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+    return f"{HASH_NAME}:{hasher.hexdigest()}"
+
+
+def _file_identity(path):
+    """Returns [inode, size, mtime_ns] of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+class DedupCache:
+    """
+    Maps a content hash plus the processing settings to the outputs already written for it, in SQLite.
+    Each output is stored with its inode, size and mtime. Entries whose outputs were deleted or replaced
+    since (e.g. by the output of another image with the same file name) are dropped on lookup, and once
+    more than max_entries are stored the least recently used are evicted. Safe to share between worker
+    threads; worker processes each open their own connection, so give a cache_path to share hits between
+    processes.
+    """
+    def __init__(self, cache_path=None, max_entries=10000):
+        """
+        Initializes the DedupCache.
+
+        Args:
+            cache_path (str): SQLite file to keep the cache in. Defaults to None, which keeps it in memory only.
+            max_entries (int): Entries to keep before evicting the least recently used. Defaults to 10000.
+        """
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._token = os.path.abspath(cache_path) if cache_path else uuid.uuid4().hex
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        conn, lock = _connect(self._token, cache_path)
+        with lock:
+            count = conn.execute("SELECT COUNT(*) FROM dedup").fetchone()[0]
+        logging.info(f"Dedup cache opened: {cache_path or 'in memory'} ({count} entries, {HASH_NAME})")
+
+    def lookup(self, key):
+        """
+        Finds the outputs written for a key and marks the entry as recently used.
+
+        Args:
+            key (str): Content hash plus settings, as built by ImageProcessor.
+
+        Returns:
+            list: Paths of the cached outputs, or None on a miss (or if any output no longer exists or was
+                replaced by a different file).
+        """
+        conn, lock = _connect(self._token, self.cache_path)
+        with lock:
+            row = conn.execute("SELECT outputs FROM dedup WHERE key = ?", (key,)).fetchone()
+            entries = json.loads(row[0]) if row else None
+            outputs = None
+            # Entries written before identities were recorded hold bare paths and are dropped too
+            if entries and all(isinstance(entry, list) and _file_identity(entry[0]) == entry[1:] for entry in entries):
+                outputs = [entry[0] for entry in entries]
+            elif entries:
+                conn.execute("DELETE FROM dedup WHERE key = ?", (key,))
+            if outputs:
+                conn.execute("UPDATE dedup SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        return outputs
+
+    def store(self, key, outputs):
+        """
+        Records the outputs written for a key, together with their current inode, size and mtime.
+
+        Args:
+            key (str): Content hash plus settings.
+            outputs (list): Paths of the outputs, in pipeline order.
+        """
+        entries = []
+        for path in outputs:
+            identity = _file_identity(path)
+            if identity is None:
+                return # Already removed again; nothing to reuse
+            entries.append([os.path.abspath(path)] + identity)
+        conn, lock = _connect(self._token, self.cache_path)
+        with lock:
+            conn.execute("INSERT OR REPLACE INTO dedup (key, outputs, last_used) VALUES (?, ?, ?)",
+                         (key, json.dumps(entries), time.time()))
+            # Counted rather than tracked, as other processes may add entries to the same file
+            count = conn.execute("SELECT COUNT(*) FROM dedup").fetchone()[0]
+            if count > self.max_entries:
+                self._evict(conn, count)
+            conn.commit()
+
+    def _evict(self, conn, count):
+        # Drop an extra 10% so eviction runs once per batch of inserts instead of on every insert
+        excess = count - int(self.max_entries * 0.9)
+        cutoff = conn.execute(
+            "SELECT last_used FROM dedup ORDER BY last_used LIMIT 1 OFFSET ?", (excess - 1,)).fetchone()
+        if cutoff is None:
+            return
+        evicted = conn.execute("DELETE FROM dedup WHERE last_used <= ?", cutoff).rowcount
+        logging.info(f"Dedup cache evicted {evicted} least recently used entries.")
+
+    def close(self):
+        """Closes this process's connection to the cache."""
+        with _connections_lock:
+            entry = _connections.pop((os.getpid(), self._token), None)
+        if entry is not None:
+            with entry[1]:
+                entry[0].close()
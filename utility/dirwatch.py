@@ -0,0 +1,345 @@
+# Directory watching backends: inotify on Linux, os.scandir polling everywhere else.
+# Both watch any number of WatchSource roots, recursively if a source asks for it, from a single thread.
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def is_image_file(filename):
+    """Returns True if the file name has one of the supported image extensions."""
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def scan_folder(source, folder, found, subfolders, stats=None):
+    """
+    Lists one folder with a single os.scandir pass. The entry type comes from the directory entry,
+    so no extra stat call is made per file.
+
+    Args:
+        source (WatchSource): Source the folder belongs to.
+        folder (str): Folder to scan.
+        found (list): Receives (source, path) for every image file the source accepts.
+        subfolders (list): Receives the subfolders the source wants watched.
+        stats (dict): If given, receives path -> stat result of every accepted image, taken from the
+            directory entry (free on Windows, one stat call each elsewhere).
+
+    Returns:
+        list: Names of all image files in the folder, in directory order.
+    """
+    names = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if source.should_descend(entry.path):
+                    subfolders.append(entry.path)
+            elif is_image_file(entry.name) and entry.is_file():
+                if stats is not None and source.matches(entry.path):
+                    try:
+                        stats[entry.path] = entry.stat()
+                    except FileNotFoundError:
+                        continue # Removed while listing
+                names.append(entry.name)
+                if found is not None and source.matches(entry.path):
+                    found.append((source, entry.path))
+    return names
+
+
+class PollingBackend:
+    """
+    Finds new files by re-scanning the watched folders every interval.
+    A folder is only re-listed when its modification time has changed.
+    """
+    name = "polling"
+
+    # Directory mtimes can be coarse (e.g. 2 s on FAT), so recently modified folders are always re-scanned
+    MTIME_GRANULARITY = 2
+
+    def __init__(self, sources, interval=1):
+        """
+        Initializes the PollingBackend.
+
+        Args:
+            sources (list): WatchSource objects to watch.
+            interval (float): Seconds between scans. Defaults to 1.
+        """
+        self.sources = sources
+        self.interval = interval
+        self._folders = {} # folder -> (source, mtime_ns when last listed, {image name: (inode, mtime_ns)})
+        self._last_scan = time.monotonic()
+
+    def initial_scan(self, stats=None):
+        """
+        Returns (source, path) for every image file currently in the watched folders.
+
+        Args:
+            stats (dict): If given, receives path -> stat result of every file found.
+        """
+        found = []
+        for source in self.sources:
+            self._scan_tree(source, source.root, found, stats)
+        self._last_scan = time.monotonic()
+        return found
+
+    def _scan_tree(self, source, folder, found, stats=None):
+        """
+        Lists a folder and its new subfolders. A file is reported when its name is new or its inode or
+        mtime changed since the last listing, so a new file that reuses the name of one removed
+        in between two scans is not missed.
+        """
+        pending = [folder]
+        while pending:
+            current = pending.pop()
+            listed = {} if stats is None else stats
+            try:
+                mtime_ns = os.stat(current).st_mtime_ns
+                subfolders = []
+                names = scan_folder(source, current, None, subfolders, listed)
+            except FileNotFoundError:
+                if current == source.root:
+                    raise
+                self._folders.pop(current, None)
+                continue
+            known = self._folders[current][2] if current in self._folders else {}
+            seen = {}
+            for name in names:
+                path = os.path.join(current, name)
+                st = listed.get(path)
+                if st is None:
+                    continue # Not accepted by the source, or removed while listing
+                seen[name] = (st.st_ino, st.st_mtime_ns)
+                if known.get(name) != seen[name]:
+                    found.append((source, path))
+            self._folders[current] = (source, mtime_ns, seen)
+            pending.extend(subfolder for subfolder in subfolders if subfolder not in self._folders)
+
+    def wait_for_files(self, stop_event, timeout=None):
+        """
+        Waits until one interval has passed since the last scan, then returns the image files
+        that appeared since then.
+
+        Args:
+            stop_event (threading.Event): Returns early with no files when set.
+            timeout (float): Return with no files after this many seconds if the next scan is not due
+                by then. Defaults to None (wait for the scan).
+
+        Returns:
+            list: (source, path, complete) of newly seen image files. complete is always False, as a
+                listed file may still be being copied in.
+        """
+        due_in = self.interval - (time.monotonic() - self._last_scan)
+        if timeout is not None and timeout < due_in:
+            stop_event.wait(timeout)
+            return []
+        if stop_event.wait(max(0.0, due_in)):
+            return []
+        self._last_scan = time.monotonic()
+        found = []
+        now = time.time()
+        for folder, (source, mtime_ns, _) in list(self._folders.items()):
+            try:
+                st = os.stat(folder)
+            except FileNotFoundError:
+                if folder == source.root:
+                    raise
+                self._folders.pop(folder, None)
+                continue
+            if st.st_mtime_ns == mtime_ns and now - st.st_mtime > self.MTIME_GRANULARITY:
+                continue
+            self._scan_tree(source, folder, found)
+        return [(source, path, False) for source, path in found]
+
+    def close(self):
+        """Nothing to release for the polling backend."""
+
+
+class InotifyBackend:
+    """
+    Reacts to IN_CLOSE_WRITE and IN_MOVED_TO events from the Linux kernel, so new files are
+    seen as soon as they are fully written and folders are never re-listed. Every watched folder
+    shares one inotify descriptor; new subfolders are added as they appear.
+    """
+    name = "inotify"
+
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self, sources, interval=1):
+        """
+        Initializes the InotifyBackend.
+
+        Args:
+            sources (list): WatchSource objects to watch.
+            interval (float): Longest time to block waiting for events, so stop requests are noticed.
+
+        Raises:
+            OSError: If inotify is not available on this system.
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.sources = sources
+        self.interval = interval
+        self._watches = {} # watch descriptor -> (source, folder)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        try:
+            for source in sources:
+                self._add_watch(source, source.root)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _add_watch(self, source, folder):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), self.WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed for {folder}: {os.strerror(errno)}")
+        self._watches[wd] = (source, folder)
+
+    def _watch_tree(self, source, folder, found, stats=None):
+        """
+        Watches a folder and its wanted subfolders, then lists them. Watching before listing means a
+        file created in between shows up as an event, a listing entry, or both, but is never missed.
+        """
+        pending = [folder]
+        while pending:
+            current = pending.pop()
+            try:
+                if current != source.root:
+                    try:
+                        self._add_watch(source, current)
+                    except OSError as e:
+                        if isinstance(e, FileNotFoundError):
+                            raise
+                        # e.g. ENOSPC when fs.inotify.max_user_watches is reached; existing files are still listed
+                        logging.warning(f"Cannot watch {current}, new files there will be missed: {e}")
+                scan_folder(source, current, found, pending, stats)
+            except FileNotFoundError:
+                if current == source.root:
+                    raise
+            except OSError as e:
+                logging.warning(f"Cannot list {current}: {e}")
+
+    def initial_scan(self, stats=None):
+        """
+        Returns every image file currently in the watched folders. Later events are queued by the kernel.
+
+        Args:
+            stats (dict): If given, receives path -> stat result of every file found.
+        """
+        found = []
+        for source in self.sources:
+            self._watch_tree(source, source.root, found, stats)
+        return found
+
+    def wait_for_files(self, stop_event, timeout=None):
+        """
+        Blocks until events arrive or the timeout passes, then returns the image files
+        that were closed after writing or moved into a watched folder.
+
+        Args:
+            stop_event (threading.Event): Checked by the caller between waits.
+            timeout (float): Longest wait in seconds. Defaults to None (the interval).
+
+        Returns:
+            list: (source, path, complete) of new image files. complete is True for files reported by
+                IN_CLOSE_WRITE or IN_MOVED_TO, which are only sent once the file is fully written, and False
+                for files found by listing new subfolders or re-listing folders, which may still be open
+                for writing.
+
+        Raises:
+            FileNotFoundError: If a watched root folder was deleted or moved away.
+        """
+        if stop_event.is_set():
+            return []
+        readable, _, _ = select.select([self._fd], [], [], self.interval if timeout is None else timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        found = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("inotify queue overflowed; re-scanning watched folders.")
+                return [(source, path, False) for source, path in self.initial_scan()]
+            if wd not in self._watches:
+                continue
+            source, folder = self._watches[wd]
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                if folder == source.root:
+                    raise FileNotFoundError(f"Watched folder {folder} was removed or moved.")
+                if mask & IN_MOVE_SELF:
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                self._watches.pop(wd, None)
+                continue
+            if not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and source.should_descend(path):
+                    # Files already in a new subfolder were found by listing it, not by a close-write
+                    # event, so they may still be open for writing and must settle first
+                    listed = []
+                    self._watch_tree(source, path, listed)
+                    found.extend((source, path, False) for source, path in listed)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and source.matches(path):
+                found.append((source, path, True))
+        return found
+
+    def close(self):
+        """Closes the inotify file descriptor."""
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+            self._fd = None
+
+
+def create_backend(sources, interval=1, use_inotify=True):
+    """
+    Creates the best available watching backend for a set of folders.
+
+    Args:
+        sources (list): WatchSource objects to watch.
+        interval (float): Polling interval, or the longest event wait for inotify.
+        use_inotify (bool): Try inotify first. Defaults to True.
+
+    Returns:
+        InotifyBackend or PollingBackend: The backend to use.
+    """
+    if use_inotify:
+        try:
+            return InotifyBackend(sources, interval)
+        except (OSError, AttributeError) as e:
+            logging.info(f"inotify unavailable ({e}); falling back to polling.")
+    return PollingBackend(sources, interval)
@@ -0,0 +1,184 @@
+# Crash-safe file writes and moves.
+
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Name prefix of the temporary files written next to outputs, so ones left behind by a crash can be found
+TEMP_PREFIX = ".grayscaler-tmp-"
+# Temporary files older than this are left over from an interrupted write; younger ones may still be in use
+STALE_TEMP_SECONDS = 3600
+
+# The process umask, which can only be read by setting it; read once at import, before any worker threads exist
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def fsync_directory(folder):
+    """
+    Flushes a directory entry to disk so a rename inside it survives a crash.
+    Not supported on Windows, where it is skipped.
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data):
+    """
+    Writes data to a hidden temporary file next to path, fsyncs it and renames it into place,
+    so readers only ever see the complete file. The file gets the usual permissions for a new
+    file under the process umask (e.g. 0644), not mkstemp's private 0600.
+
+    Args:
+        path (str): Final path of the file.
+        data (bytes-like): Contents to write. Buffer objects such as NumPy arrays are written
+            without being copied.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=f"{TEMP_PREFIX}{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        if hasattr(os, "fchmod"):
+            os.fchmod(fd, 0o666 & ~_UMASK)
+        view = memoryview(data).cast("B")
+        with os.fdopen(fd, "wb") as f:
+            f.write(view)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(folder)
+    return view.nbytes
+
+
+def move_to_folder(path, folder):
+    """
+    Moves a file into a folder without overwriting an existing file of the same name,
+    and makes sure the move is on disk before returning. The destination name is reserved with an
+    exclusively created placeholder first, so concurrent moves of same-named files never collide.
+
+    Args:
+        path (str): File to move.
+        folder (str): Destination folder, created if needed.
+
+    Returns:
+        str: The new path of the file.
+    """
+    os.makedirs(folder, exist_ok=True)
+    base, ext = os.path.splitext(os.path.basename(path))
+    destination = os.path.join(folder, base + ext)
+    counter = 1
+    while True:
+        try:
+            os.close(os.open(destination, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+            break
+        except FileExistsError:
+            destination = os.path.join(folder, f"{base}_{counter}{ext}")
+            counter += 1
+    try:
+        try:
+            # Replaces only our own placeholder
+            os.replace(path, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Different file system: copy durably first, then remove the source
+            shutil.copy2(path, destination)
+            with open(destination, "r+b") as f:
+                os.fsync(f.fileno())
+            os.remove(path)
+            logging.info(f"Copied {path} across file systems to {destination}")
+    except BaseException:
+        try:
+            os.remove(destination) # The placeholder or a copy whose source could not be removed
+        except OSError:
+            pass
+        raise
+    fsync_directory(folder)
+    return destination
+
+
+def link_or_copy(source, path):
+    """
+    Makes path a hard link to source, or a copy where hard links are not possible (e.g. across
+    file systems). Like atomic_write, the new file only appears under its final name once complete.
+
+    Args:
+        source (str): Existing file.
+        path (str): Path to create or replace.
+
+    Returns:
+        bool: True if a hard link was made, False if the file was copied.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    temp_path = os.path.join(folder, f"{TEMP_PREFIX}{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        try:
+            os.link(source, temp_path)
+            linked = True
+        except OSError:
+            shutil.copyfile(source, temp_path)
+            with open(temp_path, "r+b") as f:
+                os.fsync(f.fileno())
+            linked = False
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(folder)
+    return linked
+
+
+def remove_stale_temp_files(folder, max_age=STALE_TEMP_SECONDS):
+    """
+    Removes the temporary files that atomic_write and link_or_copy left in a folder tree when the
+    process was killed mid-write. Recent ones are kept, since another process may still be writing them.
+
+    Args:
+        folder (str): Folder to clean, including its subfolders. A missing folder is skipped.
+        max_age (float): Only temporary files last modified more than this many seconds ago are removed.
+            Defaults to STALE_TEMP_SECONDS.
+
+    Returns:
+        int: Number of files removed.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    pending = [folder]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.startswith(TEMP_PREFIX) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                            os.remove(entry.path)
+                            removed += 1
+                    except OSError:
+                        pass # Removed or renamed in the meantime
+        except OSError:
+            continue
+    if removed:
+        logging.info(f"Removed {removed} stale temporary files from {folder}")
+    return removed
@@ -1,88 +1,415 @@
-# Monitors a folder for new image files and processes them. 
-
-import threading
-import logging
-import os
-import time
-
-
-class FileWatcher:
-    """
-    Monitors a folder for new image files and processes them.
-    """
-    def __init__(self, folder_path, image_processor, log_queue_callback, update_interval=1):
-        """
-        Initializes the FileWatcher.
-
-        Args:
-            folder_path (str): Path to the folder to monitor.
-            image_processor (ImageProcessor): Instance of ImageProcessor to handle image processing.
-            log_queue_callback (function): Callback function to add messages to the app's log queue.
-            update_interval (int): How often to check for new files, in seconds.  Defaults to 1.
-        """
-        self.folder_path = folder_path
-        self.image_processor = image_processor
-        self.log_queue_callback = log_queue_callback # Use callback for logging to app
-        self.update_interval = update_interval
-        self.stop_flag = threading.Event()
-        self.processed_files = set()
-
-    def watch(self):
-        """
-        Starts monitoring the folder for new image files.
-        """
-        self.log_message_to_app(f"Watching folder: {self.folder_path}")
-        while not self.stop_flag.is_set():
-            try:
-                # Check if folder still exists
-                if not os.path.exists(self.folder_path):
-                    self.log_message_to_app(f"Error: Monitored folder {self.folder_path} no longer exists. Stopping watch.")
-                    logging.error(f"Monitored folder {self.folder_path} no longer exists.")
-                    break # Exit the loop
-
-                files = [f for f in os.listdir(self.folder_path)
-                           if os.path.isfile(os.path.join(self.folder_path, f)) and
-                              f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-                for filename in files:
-                    if self.stop_flag.is_set(): break # Check stop flag frequently
-                    image_path = os.path.join(self.folder_path, filename)
-                    # Check if file still exists before processing (it might be moved/deleted quickly)
-                    if not os.path.exists(image_path):
-                        self.processed_files.discard(filename) # Remove if it was somehow added then disappeared
-                        continue
-
-                    if filename not in self.processed_files:
-                        self.log_message_to_app(f"New image detected: {filename}")
-                        gray_path = self.image_processor.convert_to_grayscale(image_path, filename)
-                        if gray_path:
-                            self.image_processor.delete_original(image_path)
-                            self.log_message_to_app(f"Processed and original deleted: {filename}")
-                        else:
-                            self.log_message_to_app(f"Failed to process: {filename}")
-                        self.processed_files.add(filename)
-                if self.stop_flag.is_set(): break
-                time.sleep(self.update_interval)
-            except FileNotFoundError:
-                 self.log_message_to_app(f"Error: Monitored folder {self.folder_path} not found. Stopping watch.")
-                 logging.error(f"Monitored folder {self.folder_path} not found during watch.")
-                 break # Exit the loop
-            except Exception as e:
-                logging.error(f"Error watching folder {self.folder_path}: {e}")
-                self.log_message_to_app(f"Error in watcher: {e}")
-                time.sleep(self.update_interval * 2) # Sleep longer on generic error
-
-        self.log_message_to_app("File watcher stopped.")
-
-
-    def log_message_to_app(self, message):
-        """
-        Uses the callback to add a message to the main application's log queue.
-        """
-        self.log_queue_callback(message) # The callback will handle timestamping
-
-    def stop(self):
-        """
-        Sets the stop flag, signaling the watching thread to exit.
-        """
-        self.stop_flag.set()
+# Monitors one or more folders for new image files and processes them. 
+
+import threading
+import inspect
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from .backlog import Backlog
+from .claims import CLAIMS_FOLDER_NAME, ClaimManager
+from .dedupcache import STATS_LOG_INTERVAL
+from .dirwatch import create_backend
+from .fileops import remove_stale_temp_files
+from .logsetup import PER_FILE
+from .processedindex import ProcessedIndex
+from .retryqueue import RetryQueue, move_to_dead_letter
+from .stability import StabilityTracker, MISSING, PENDING
+from .watchsource import WatchSource
+from .workerpool import WorkerPool, process_image
+
+# How long the loop waits for new files while the startup backlog is draining, so the workers are kept fed
+BACKLOG_POLL_SECONDS = 0.05
+
+class FileWatcher:
+    """
+    Monitors one or more folders (optionally recursively) for new image files and processes them.
+    All folders share one discovery loop and one worker pool.
+    """
+    def __init__(self, folder_path, image_processor, log_queue_callback, update_interval=1,
+                 workers=1, use_processes=False, max_pending=None, use_inotify=True,
+                 settle_time=2, max_attempts=5, retry_delay=1, dead_letter_folder=None,
+                 index_path=None, index_max_entries=100000, metrics=None, memory_budget=None,
+                 backlog_policy="oldest", claim_files=False, node_id=None, claim_lease=30):
+        """
+        Initializes the FileWatcher.
+
+        Args:
+            folder_path (str, WatchSource or list): Folder to monitor, or a list of folders / WatchSource
+                objects to monitor together. Plain folder paths are watched without subfolders.
+            image_processor (ImageProcessor): Instance of ImageProcessor to handle image processing.
+            log_queue_callback (function): Callback function to add messages to the app's log queue, called
+                with the message and its logging level (PER_FILE for the lines logged for every image).
+                Callbacks that only take the message are called with just the message.
+            update_interval (int): How often to check for new files, in seconds.  Defaults to 1.
+            workers (int): Number of conversion workers. Defaults to 1.
+            use_processes (bool): Run workers as processes instead of threads. Defaults to False.
+            max_pending (int): Maximum files queued for conversion before the watcher waits.
+                Defaults to four times the worker count.
+            use_inotify (bool): React to inotify events on Linux instead of polling. Falls back to
+                polling automatically when inotify is unavailable. Defaults to True.
+            settle_time (float): Seconds a polled file must stay unchanged before it is converted,
+                so partially copied files are not picked up. Defaults to 2.
+            max_attempts (int): Conversion attempts per file before it is moved to the dead-letter
+                folder. Defaults to 5.
+            retry_delay (float): Delay before the first retry, doubled on every further attempt. Defaults to 1.
+            dead_letter_folder (str): Where files that keep failing are moved.
+                Defaults to a 'failed_images' subfolder of each monitored root.
+            index_path (str): SQLite file that remembers processed files across restarts.
+                Defaults to None, which keeps the index in memory.
+            index_max_entries (int): Processed files to remember before the oldest are evicted. Defaults to 100000.
+            metrics (PipelineMetrics): Collects throughput, latency and failure metrics if given.
+                Defaults to None, which skips all instrumentation.
+            memory_budget (int): Bytes that images being converted at the same time may use together,
+                estimated from their headers. Large images wait until enough of the budget is free.
+                Defaults to None (no limit).
+            backlog_policy (str): Order in which files already waiting at startup are converted:
+                'oldest', 'newest' or 'smallest' first. Files arriving later always go ahead of them.
+                Defaults to 'oldest'.
+            claim_files (bool): Claim each file before converting it, so several watchers (on one or more
+                hosts) can share the same folders without converting a file twice. Defaults to False.
+            node_id (str): Name of this watcher among those sharing the folders. Defaults to host name and process id.
+            claim_lease (float): Seconds without a heartbeat after which another watcher's claimed files
+                are taken back. Defaults to 30.
+        """
+        if isinstance(folder_path, (str, WatchSource)):
+            folder_path = [folder_path]
+        self.sources = [source if isinstance(source, WatchSource) else WatchSource(source) for source in folder_path]
+        self.folder_path = self.sources[0].root
+        self.image_processor = image_processor
+        self.log_queue_callback = log_queue_callback # Use callback for logging to app
+        self._callback_takes_level = self._accepts_level(log_queue_callback)
+        self.update_interval = update_interval
+        self.stop_flag = threading.Event()
+        self.processed_files = ProcessedIndex(index_path, index_max_entries)
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_pending = max_pending
+        self.memory_budget = memory_budget
+        self.use_inotify = use_inotify
+        self.dead_letter_folder = dead_letter_folder
+        self.stability = StabilityTracker(settle_time)
+        self.retry_queue = RetryQueue(max_attempts=max_attempts, base_delay=retry_delay)
+        self.pool = None
+        self.backend = None
+        self._candidates = OrderedDict() # path -> True if known to be completely written
+        self.backlog = Backlog(backlog_policy) # Files found by the startup scan, fed to the pool a few at a time
+        self._backlog_started = None # time.monotonic() of the startup scan, while the backlog is draining
+        self._active = {} # path -> WatchSource, for files waiting to settle, queued, converting or waiting for a retry
+        self._keys = {} # path -> processed-index key taken when the file was submitted
+        self.claims = ClaimManager([source.root for source in self.sources], node_id, claim_lease) if claim_files else None
+        self._claimed = {} # path -> path of the claimed copy being converted or waiting for a retry
+        self.metrics = metrics
+        self._detected_at = {} # path -> time.time() of discovery, only tracked when metrics are enabled
+        self._dedup_counts = {"hit": 0, "miss": 0} # Dedup cache results reported back by the workers
+        self._state_lock = threading.Lock()
+
+        # Never pick up our own outputs, archived originals or dead letters when they live inside a watched tree
+        for source in self.sources:
+            for folder in (image_processor.output_folder, image_processor.archive_folder, source.output_folder,
+                           self._dead_letter_folder_for(source), os.path.join(source.root, CLAIMS_FOLDER_NAME)):
+                source.skip(folder)
+
+    def watch(self):
+        """
+        Starts monitoring the folders for new image files.
+        """
+        for source in self.sources:
+            self.log_message_to_app(f"Watching folder: {source.root}{' (including subfolders)' if source.recursive else ''}")
+        # Clear out temporary files from writes interrupted by an earlier crash
+        output_folders = {self.image_processor.output_folder} | {source.output_folder for source in self.sources}
+        for folder in output_folders - {None}:
+            remove_stale_temp_files(folder)
+        self.pool = WorkerPool(self.workers, self.use_processes, self.max_pending, self.memory_budget)
+        if self.claims is not None:
+            self.claims.start()
+            self.log_message_to_app(f"Sharing the folders with other watchers as node {self.claims.node_id}.")
+        if self.metrics is not None:
+            self.metrics.set_gauge("queue_depth", self.queue_depth)
+            self.metrics.set_gauge("backlog_remaining", lambda: len(self.backlog))
+        while not self.stop_flag.is_set():
+            try:
+                # Check if the folders still exist
+                missing = [source.root for source in self.sources if not os.path.exists(source.root)]
+                if missing:
+                    self.log_message_to_app(f"Error: Monitored folder {missing[0]} no longer exists. Stopping watch.")
+                    logging.error(f"Monitored folder {missing[0]} no longer exists.")
+                    break # Exit the loop
+
+                if self.backend is None:
+                    self.backend = create_backend(self.sources, self.update_interval, self.use_inotify)
+                    self.log_message_to_app(f"Using {self.backend.name} directory watching.")
+                    stats = {}
+                    self._add_backlog(self.backend.initial_scan(stats), stats)
+
+                self._add_candidates(self.retry_queue.pop_due(), retry=True)
+                if not self._submit_ready(): break
+                if not self._feed_backlog(): break
+                if self.stop_flag.is_set(): break
+                # While backlog files are left, look for new ones often so the workers never run dry
+                self._add_candidates(self.backend.wait_for_files(
+                    self.stop_flag, BACKLOG_POLL_SECONDS if self.backlog.queued else None))
+            except FileNotFoundError as e:
+                 self.log_message_to_app(f"Error: Monitored folder not found ({e}). Stopping watch.")
+                 logging.error(f"Monitored folder not found during watch: {e}")
+                 break # Exit the loop
+            except Exception as e:
+                logging.error(f"Error watching folders: {e}")
+                self.log_message_to_app(f"Error in watcher: {e}")
+                time.sleep(self.update_interval * 2) # Sleep longer on generic error
+
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
+        self.pool.shutdown()
+        if self.claims is not None:
+            self.claims.stop() # Hands files claimed but not converted back to the other watchers
+        self.processed_files.close()
+        if any(self._dedup_counts.values()):
+            self.log_message_to_app(f"Dedup cache: {self._dedup_stats_text()}")
+        self.log_message_to_app("File watcher stopped.")
+
+    def _add_candidates(self, found, retry=False):
+        """
+        Queues newly discovered files, given as (source, path, complete) with complete True if the file
+        is known to be fully written, or retried paths, for the settle check and conversion.
+        """
+        with self._state_lock:
+            for item in found:
+                if retry:
+                    # A file may have failed because it was still being written, so it must settle again
+                    self._candidates[item] = False
+                    continue
+                source, path, complete = item
+                if path in self._active:
+                    continue
+                # Keyed on size, mtime and inode too, so a new file reusing an old name is not skipped
+                if ProcessedIndex.key_for(path) in self.processed_files:
+                    continue
+                self._active[path] = source
+                self._candidates[path] = complete
+                if self.metrics is not None:
+                    self._detected_at[path] = time.time()
+
+    def _add_backlog(self, found, stats):
+        """
+        Queues the files found by the startup scan in backlog order. The stat results from the
+        scan double as processed-index keys, so already processed files cost no extra stat call.
+        """
+        started = time.monotonic()
+        items = []
+        with self._state_lock:
+            for source, path in found:
+                st = stats.get(path)
+                # On Windows scandir's stat leaves st_ino at 0, so fall back to a real stat there
+                key = ((os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino) if st is not None and st.st_ino
+                       else ProcessedIndex.key_for(path))
+                if path in self._active or key in self.processed_files:
+                    continue
+                self._active[path] = source
+                if self.metrics is not None:
+                    self._detected_at[path] = time.time()
+                items.append((source, path))
+        if not items:
+            return
+        self.backlog.extend(items, stats)
+        self._backlog_started = started
+        self.log_message_to_app(f"Found {len(items)} waiting images; converting them {self.backlog.policy} first "
+                                f"(scanned in {time.monotonic() - started:.1f}s)")
+
+    def _feed_backlog(self):
+        """
+        Tops the pool up from the backlog without blocking, keeping only about one job per worker
+        queued so files that arrive meanwhile are not stuck behind the whole backlog.
+        Backlog files still being written wait with the other candidates until they settle.
+
+        Returns:
+            bool: False if the watcher was stopped while waiting for the pool.
+        """
+        while self.backlog.queued and self.pool.pending < self.pool.workers * 2:
+            if self.stop_flag.is_set(): return False
+            _, image_path = self.backlog.pop()
+            state = self.stability.check(image_path)
+            if state == MISSING:
+                self._forget(image_path)
+            elif state == PENDING:
+                with self._state_lock:
+                    self._candidates[image_path] = False
+            elif not self._submit(image_path):
+                return False
+        if self._backlog_started is not None and not len(self.backlog):
+            self.log_message_to_app(f"Backlog finished: {self.backlog.total} images "
+                                    f"in {time.monotonic() - self._backlog_started:.1f}s")
+            self._backlog_started = None
+        return True
+
+    def _submit_ready(self):
+        """
+        Hands every candidate that has finished being written to the worker pool.
+
+        Returns:
+            bool: False if the watcher was stopped while waiting for the pool.
+        """
+        for image_path, complete in list(self._candidates.items()):
+            if self.stop_flag.is_set(): return False # Check stop flag frequently
+            # A claimed file waiting for a retry stays in this watcher's claim folder
+            current_path = self._claimed.get(image_path, image_path)
+            state = self.stability.check(current_path) if not complete else None
+            # Check if file still exists before processing (it might be moved/deleted quickly)
+            if state == MISSING or (complete and not os.path.exists(current_path)):
+                self._forget(image_path)
+                continue
+            if state == PENDING:
+                continue # Still being written; checked again on the next pass
+            if not self._submit(image_path):
+                return False
+            self._candidates.pop(image_path, None)
+        return True
+
+    def _submit(self, image_path):
+        """
+        Hands one settled file to the worker pool.
+
+        Returns:
+            bool: False if the watcher was stopped while waiting for the pool.
+        """
+        source = self._active[image_path]
+        output_folder = source.output_folder_for(image_path, self.image_processor.output_folder)
+        if image_path in self._claimed:
+            # A retry of a file still in this watcher's claim folder; the key taken on the first attempt still applies
+            run_path, key = self._claimed[image_path], self._keys.get(image_path)
+        else:
+            run_path, key = image_path, ProcessedIndex.key_for(image_path)
+        if self.claims is not None and run_path == image_path:
+            run_path = self.claims.claim(source.root, image_path)
+            if run_path is None:
+                self._forget(image_path) # Another watcher took it first
+                return True
+        self.log_message_to_app(f"New image detected: {self._display_name(image_path)}", PER_FILE)
+        with self._state_lock:
+            self._keys[image_path] = key
+            if run_path != image_path:
+                self._claimed[image_path] = run_path
+        cost = self.image_processor.estimate_memory(run_path) if self.memory_budget else 0
+        # Blocks while the pool is full (or the memory budget is used up), so discovery never runs far ahead of conversion
+        return self.pool.submit(lambda future, path=image_path: self._on_processed(path, future),
+                                process_image, self.image_processor, run_path, os.path.basename(image_path),
+                                True, output_folder, stop_event=self.stop_flag, cost=cost)
+
+    def _display_name(self, image_path):
+        """File name relative to its watched root, e.g. 'day1/img.jpg' (just 'img.jpg' for flat folders)."""
+        source = self._active.get(image_path)
+        return source.relative_path(image_path) if source else os.path.basename(image_path)
+
+    def _dead_letter_folder_for(self, source):
+        return self.dead_letter_folder or os.path.join(source.root, "failed_images")
+
+    def _forget(self, image_path):
+        with self._state_lock:
+            self._candidates.pop(image_path, None)
+            self._active.pop(image_path, None)
+            self._claimed.pop(image_path, None)
+            self._keys.pop(image_path, None)
+            self._detected_at.pop(image_path, None)
+        self.backlog.mark_done(image_path)
+        # A file removed while waiting for a retry would otherwise keep its attempt count forever
+        self.retry_queue.forget(image_path)
+
+    def _on_processed(self, image_path, future):
+        """
+        Reports the result of a conversion job and schedules a retry on failure. Called from a pool thread.
+        """
+        filename = self._display_name(image_path)
+        try:
+            gray_path, stats = future.result()
+        except Exception as e:
+            logging.error(f"Worker failed on {filename}: {e}")
+            gray_path, stats = None, {}
+        if gray_path:
+            self.retry_queue.record_success(image_path)
+            if self.metrics is not None:
+                self.metrics.record_success(stats, self._detected_at.get(image_path))
+            self._mark_done(image_path)
+            action = "archived" if self.image_processor.archive_folder else "deleted"
+            if stats.get("dedup") == "hit":
+                self.log_message_to_app(f"Processed and original {action}: {filename} "
+                                        f"(duplicate of an earlier image, existing output reused)", PER_FILE)
+            else:
+                self.log_message_to_app(f"Processed and original {action}: {filename} "
+                                        f"({stats.get('bytes_written', 0) / 1024:.1f} KB, "
+                                        f"encoded in {stats.get('encode_seconds', 0.0) * 1000:.1f} ms)", PER_FILE)
+            self._count_dedup(stats)
+            return
+
+        # A claimed file stays in this watcher's claim folder until it is retried or dead-lettered,
+        # so other watchers do not pick up (and fail on) the same file meanwhile
+        attempts, delay = self.retry_queue.record_failure(image_path)
+        if self.metrics is not None:
+            self.metrics.increment("files_failed")
+            self.metrics.increment("retries" if delay is not None else "dead_lettered")
+        if delay is not None:
+            self.log_message_to_app(f"Failed to process: {filename} (attempt {attempts}, retrying in {delay:g}s)")
+            return
+        dead_letter_folder = self._dead_letter_folder_for(self._active.get(image_path) or self.sources[0])
+        if move_to_dead_letter(self._claimed.get(image_path, image_path), dead_letter_folder):
+            self.log_message_to_app(f"Failed to process: {filename} after {attempts} attempts; moved to {dead_letter_folder}")
+        else:
+            self.log_message_to_app(f"Failed to process: {filename} after {attempts} attempts")
+        self._mark_done(image_path)
+
+    def _count_dedup(self, stats):
+        """Tallies a dedup cache hit or miss, logging the totals every STATS_LOG_INTERVAL lookups."""
+        if "dedup" not in stats:
+            return
+        with self._state_lock:
+            self._dedup_counts[stats["dedup"]] += 1
+            report = sum(self._dedup_counts.values()) % STATS_LOG_INTERVAL == 0
+        if report:
+            self.log_message_to_app(f"Dedup cache: {self._dedup_stats_text()}")
+
+    def _dedup_stats_text(self):
+        hits, misses = self._dedup_counts["hit"], self._dedup_counts["miss"]
+        return f"{hits} hits, {misses} misses ({100 * hits / max(1, hits + misses):.1f}% hit rate)"
+
+    def _mark_done(self, image_path):
+        with self._state_lock:
+            self._active.pop(image_path, None)
+            self._claimed.pop(image_path, None)
+            self.processed_files.add(self._keys.pop(image_path, None))
+            self._detected_at.pop(image_path, None)
+        self.backlog.mark_done(image_path)
+
+    def queue_depth(self):
+        """
+        Returns:
+            int: Files discovered but not yet converted: settling, queued, converting or waiting for a retry.
+        """
+        return len(self._active)
+
+    @staticmethod
+    def _accepts_level(callback):
+        """Returns False for callbacks written before the level argument was added, which take only the message."""
+        try:
+            inspect.signature(callback).bind("", logging.INFO)
+        except TypeError:
+            return False
+        except ValueError:
+            pass # No signature available (some builtins); assume it takes both
+        return True
+
+    def log_message_to_app(self, message, level=logging.INFO):
+        """
+        Uses the callback to add a message to the main application's log queue.
+        """
+        if self._callback_takes_level:
+            self.log_queue_callback(message, level) # The callback will handle timestamping
+        else:
+            self.log_queue_callback(message)
+
+    def stop(self):
+        """
+        Sets the stop flag, signaling the watching thread to exit.
+        """
+        self.stop_flag.set()
         logging.info("Stopping file watcher signaled.")
\ No newline at end of file
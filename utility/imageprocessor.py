@@ -1,86 +1,566 @@
-import logging
-import os
-import cv2
-
-class ImageProcessor:
-    """
-    Handles image processing tasks using OpenCV.
-    """
-    def __init__(self, output_folder="grayscale"):
-        """
-        Initializes the ImageProcessor with an output folder for grayscale images.
-
-        Args:
-            output_folder (str): The path to the folder to save grayscale images.
-        """
-        self.output_folder = output_folder
-        # No need to check for os.path.exists here, will be done before processing
-        # if not os.path.exists(self.output_folder):
-        #     try:
-        #         os.makedirs(self.output_folder)
-        #         logging.info(f"Created output folder: {self.output_folder}")
-        #     except OSError as e:
-        #         logging.error(f"Could not create output folder {self.output_folder}: {e}")
-        #         # Propagate the error or handle it, e.g., by setting a flag
-        #         raise # Or handle differently
-        logging.info(f"ImageProcessor initialized. Output folder set to: {self.output_folder}")
-
-    def _ensure_output_folder_exists(self):
-        """Ensures the output folder exists, creating it if necessary."""
-        if not os.path.exists(self.output_folder):
-            try:
-                os.makedirs(self.output_folder)
-                logging.info(f"Created output folder: {self.output_folder}")
-                return True
-            except OSError as e:
-                logging.error(f"Could not create output folder {self.output_folder}: {e}")
-                # Potentially show a message to the user via the main app's log
-                return False
-        return True
-
-
-    def convert_to_grayscale(self, image_path, filename):
-        """
-        Converts an image to grayscale and saves it to the output folder.
-
-        Args:
-            image_path (str): Path to the input image.
-            filename (str): Name of the image file.
-
-        Returns:
-            str: Path to the saved grayscale image, or None on failure.
-        """
-        if not self._ensure_output_folder_exists():
-            # Log this specific failure within the app's UI log if possible
-            # For now, relying on standard logging
-            return None
-        try:
-            img = cv2.imread(image_path)
-            if img is None:
-                logging.error(f"Could not read image: {image_path}")
-                return None
-
-            gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            # Ensure filename doesn't have path components if it's just a name
-            base_filename = os.path.basename(filename)
-            output_path = os.path.join(self.output_folder, base_filename)
-
-            cv2.imwrite(output_path, gray_img)
-            logging.info(f"Converted to grayscale: {base_filename}, saved to {output_path}")
-            return output_path
-        except Exception as e:
-            logging.error(f"Error converting {image_path} to grayscale: {e}")
-            return None
-
-    def delete_original(self, image_path):
-        """
-        Deletes the original image file.
-
-        Args:
-            image_path (str): Path to the image to delete.
-        """
-        try:
-            os.remove(image_path)
-            logging.info(f"Deleted original image: {image_path}")
-        except Exception as e:
-            logging.error(f"Error deleting {image_path}: {e}")
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import cv2
+import numpy as np
+
+from .dedupcache import content_hash
+from .fileops import atomic_write, link_or_copy, move_to_folder
+from .largeimage import STRIP_ROWS, image_dimensions, read_bmp_grayscale
+from .logsetup import PER_FILE
+from .pipeline import OUTPUT_FORMATS, Pipeline, normalize_format
+
+# Decode flags that let the codec produce grayscale directly, optionally downscaled by 2, 4 or 8
+GRAYSCALE_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# Rough peak bytes per source pixel while decoding, measured with OpenCV: a grayscale decode keeps a
+# row buffer plus the result, a color decode the BGR image plus its grayscale copy
+GRAYSCALE_DECODE_BYTES_PER_PIXEL = 2
+COLOR_DECODE_BYTES_PER_PIXEL = 6
+
+# Scratch buffers up to this size are kept per worker thread and reused; larger ones are allocated per image
+BUFFER_REUSE_MAX_BYTES = 64 * 1024 * 1024
+
+# Leading bytes of the encoded formats an in-memory image keeps when no output format is set
+FORMAT_SIGNATURES = ((b"\xff\xd8", ".jpg"), (b"\x89PNG", ".png"), (b"BM", ".bmp"),
+                     (b"II*\x00", ".tif"), (b"MM\x00*", ".tif"))
+
+class ImageProcessor:
+    """
+    Handles image processing tasks using OpenCV.
+    """
+    def __init__(self, output_folder="grayscale", fast_decode=True, reduce_factor=1, output_format=None,
+                 jpeg_quality=None, jpeg_progressive=False, jpeg_optimize=False, png_compression=None,
+                 webp_quality=None, archive_folder=None, pipeline=None, dedup_cache=None, large_image_pixels=None):
+        """
+        Initializes the ImageProcessor with an output folder for grayscale images.
+
+        Args:
+            output_folder (str): The path to the folder to save grayscale images.
+            fast_decode (bool): Decode straight to grayscale instead of decoding the full-color image
+                and converting it. JPEG then only decodes the luma channel. Defaults to True.
+            reduce_factor (int): Downscale the output by 1, 2, 4 or 8. With fast_decode the JPEG
+                decoder produces the reduced image directly. Defaults to 1.
+            output_format (str): Extension to transcode outputs to ('.jpg', '.png', '.webp' or '.bmp').
+                Defaults to None, which keeps the input's format.
+            jpeg_quality (int): JPEG quality, 0-100. Defaults to None (OpenCV's default, 95).
+            jpeg_progressive (bool): Write progressive JPEGs. Defaults to False.
+            jpeg_optimize (bool): Optimize JPEG Huffman tables (smaller files, slower encode). Defaults to False.
+            png_compression (int): PNG zlib level, 0 (fastest) to 9 (smallest). Defaults to None (OpenCV's default).
+            webp_quality (int): WebP quality, 1-100; above 100 is lossless. Defaults to None (OpenCV's default, lossless).
+            archive_folder (str): If set, originals are moved here after conversion instead of being deleted.
+            pipeline (Pipeline): Stages and output variants applied to each decoded image, e.g. CLAHE plus
+                a thumbnail. Every output comes from the same decode. Defaults to None (one plain grayscale output).
+            dedup_cache (DedupCache): If given, an image whose contents and settings match an earlier one
+                gets hard links to (or copies of) the earlier outputs instead of being converted again.
+            large_image_pixels (int): Images with more pixels than this are always decoded straight to
+                grayscale, and uncompressed BMPs are read into one reused strip buffer and converted strip by
+                strip, so they need about a third of the memory of a color decode. Defaults to None (no special handling).
+        """
+        if reduce_factor not in GRAYSCALE_DECODE_FLAGS:
+            raise ValueError(f"reduce_factor must be one of {sorted(GRAYSCALE_DECODE_FLAGS)}, got {reduce_factor}")
+        output_format = normalize_format(output_format)
+        pipeline = pipeline or Pipeline()
+        pipeline.check_destinations(output_format)
+        self.output_folder = output_folder
+        self.fast_decode = fast_decode
+        self.reduce_factor = reduce_factor
+        self.output_format = output_format
+        self.jpeg_quality = jpeg_quality
+        self.jpeg_progressive = jpeg_progressive
+        self.jpeg_optimize = jpeg_optimize
+        self.png_compression = png_compression
+        self.webp_quality = webp_quality
+        self.archive_folder = archive_folder
+        self.pipeline = pipeline
+        self.dedup_cache = dedup_cache
+        self.large_image_pixels = large_image_pixels
+        # Everything besides the source bytes that affects the outputs, so a settings change is a cache miss
+        settings = json.dumps({
+            "fast_decode": fast_decode, "reduce_factor": reduce_factor, "output_format": output_format,
+            "large_image_pixels": large_image_pixels,
+            "encode": {extension: self._encode_params(extension) for extension in OUTPUT_FORMATS},
+            "pipeline": pipeline.config()}, sort_keys=True)
+        self._settings_key = hashlib.blake2b(settings.encode("utf-8"), digest_size=8).hexdigest()
+        self._local = None # Per-thread scratch buffers, created on first use
+        # No need to check for os.path.exists here, will be done before processing
+        # if not os.path.exists(self.output_folder):
+        #     try:
+        #         os.makedirs(self.output_folder)
+        #         logging.info(f"Created output folder: {self.output_folder}")
+        #     except OSError as e:
+        #         logging.error(f"Could not create output folder {self.output_folder}: {e}")
+        #         # Propagate the error or handle it, e.g., by setting a flag
+        #         raise # Or handle differently
+        logging.info(f"ImageProcessor initialized. Output folder set to: {self.output_folder}")
+        if not pipeline.is_default:
+            logging.info(f"Processing pipeline: {pipeline.describe()}")
+
+    def _ensure_output_folder_exists(self, output_folder=None):
+        """Ensures the output folder (or the given folder) exists, creating it if necessary."""
+        output_folder = output_folder or self.output_folder
+        if not os.path.exists(output_folder):
+            try:
+                os.makedirs(output_folder, exist_ok=True) # Another worker may create it at the same time
+                logging.info(f"Created output folder: {output_folder}")
+                return True
+            except OSError as e:
+                logging.error(f"Could not create output folder {output_folder}: {e}")
+                # Potentially show a message to the user via the main app's log
+                return False
+        return True
+
+
+    def convert_to_grayscale(self, image_path, filename, stats=None, output_folder=None):
+        """
+        Converts an image to grayscale and saves every output of the pipeline to the output folder.
+        The image is decoded once for all outputs, then converted and encoded by the same code as
+        convert_batch(). Each output is encoded in memory and written to a
+        temporary file that is fsynced and renamed into place, so a crash never leaves a truncated
+        output under the final name.
+
+        Args:
+            image_path (str): Path to the input image.
+            filename (str): Name of the image file.
+            stats (dict): If given, filled with 'bytes_read', 'bytes_written', 'outputs', and the 'hash_seconds',
+                'read_seconds', 'convert_seconds', 'encode_seconds' and 'write_seconds' stage timings (summed over
+                all outputs; pipeline stages count as conversion). With a dedup cache, 'dedup' is 'hit' or 'miss'.
+            output_folder (str): Save to this folder instead of the configured output folder,
+                e.g. a mirrored subfolder. Defaults to None.
+
+        Returns:
+            str: Path to the first output of the pipeline, or None if any output failed.
+        """
+        output_folder = output_folder or self.output_folder
+        if not self._ensure_output_folder_exists(output_folder):
+            # Log this specific failure within the app's UI log if possible
+            # For now, relying on standard logging
+            return None
+        try:
+            if stats is not None:
+                stats["bytes_read"] = os.path.getsize(image_path)
+            cache_key = None
+            if self.dedup_cache is not None:
+                hash_started = time.perf_counter()
+                # The input extension decides the output format when the pipeline keeps it
+                cache_key = f"{content_hash(image_path)}|{os.path.splitext(filename)[1].lower()}|{self._settings_key}"
+                if stats is not None:
+                    stats["hash_seconds"] = time.perf_counter() - hash_started
+                cached_outputs = self.dedup_cache.lookup(cache_key)
+                if cached_outputs:
+                    output_path = self._reuse_outputs(cached_outputs, output_folder, filename, stats)
+                    if output_path:
+                        return output_path
+                if stats is not None:
+                    stats["dedup"] = "miss"
+            gray_img = self._read_grayscale(image_path, stats, reuse_buffers=True)
+            if gray_img is None:
+                logging.error(f"Could not read image: {image_path}")
+                return None
+            if stats is not None:
+                stats.update(bytes_written=0, encode_seconds=0.0, write_seconds=0.0, outputs=0)
+
+            output_paths = [output.output_path(output_folder, filename, self.output_format)
+                            for output in self.pipeline.outputs]
+            encoded_outputs = self._run_pipeline(gray_img, [os.path.splitext(path)[1] for path in output_paths], stats,
+                                                 owned=True)
+            if encoded_outputs is None:
+                return None
+            for output, output_path, encoded in zip(self.pipeline.outputs, output_paths, encoded_outputs):
+                if output.subfolder and not self._ensure_output_folder_exists(os.path.dirname(output_path)):
+                    return None
+                write_started = time.perf_counter()
+                bytes_written = atomic_write(output_path, encoded) # Writes the encoder's buffer directly, no extra copy
+                if stats is not None:
+                    stats["bytes_written"] += bytes_written
+                    stats["write_seconds"] += time.perf_counter() - write_started
+                    stats["outputs"] += 1
+                logging.log(PER_FILE, f"Converted to grayscale ({output.name}): {os.path.basename(filename)}, "
+                                      f"saved to {output_path} ({bytes_written} bytes)")
+            if cache_key is not None:
+                self.dedup_cache.store(cache_key, output_paths)
+            return output_paths[0]
+        except Exception as e:
+            logging.error(f"Error converting {image_path} to grayscale: {e}")
+            return None
+
+    def _reuse_outputs(self, cached_outputs, output_folder, filename, stats=None):
+        """
+        Hard-links (or copies) the outputs of an identical earlier image to this image's output paths.
+
+        Returns:
+            str: Path of the first output, or None if the cached outputs could not be reused.
+        """
+        if len(cached_outputs) != len(self.pipeline.outputs):
+            return None
+        write_started = time.perf_counter()
+        output_paths = []
+        linked = 0
+        try:
+            for output, cached_path in zip(self.pipeline.outputs, cached_outputs):
+                output_path = output.output_path(output_folder, filename, self.output_format)
+                if not self._ensure_output_folder_exists(os.path.dirname(output_path)):
+                    return None
+                if os.path.abspath(output_path) != cached_path:
+                    linked += link_or_copy(cached_path, output_path)
+                output_paths.append(output_path)
+        except OSError as e:
+            logging.warning(f"Could not reuse cached output for {filename}, converting instead: {e}")
+            return None
+        if stats is not None:
+            stats.update(dedup="hit", bytes_written=0, outputs=len(output_paths),
+                         write_seconds=time.perf_counter() - write_started)
+        logging.log(PER_FILE, f"Reused outputs of an identical image for {os.path.basename(filename)}: {output_paths[0]} "
+                              f"({linked} hard-linked, {len(output_paths) - linked} copied or already in place)")
+        return output_paths[0]
+
+    def convert_batch(self, images, encode=True, input_formats=None, stats=None):
+        """
+        Converts several in-memory images at once, without touching the file system. Color images of
+        the same size and type are stacked and converted by a single cvtColor call, and when encoding,
+        the stacking and grayscale buffers are reused from call to call.
+
+        Args:
+            images (list or numpy.ndarray): Encoded images (bytes, bytearray, memoryview or 1-D uint8 arrays)
+                and/or decoded images (HxW grayscale, HxWx3 BGR or HxWx4 BGRA arrays), or a single NxHxWxC array,
+                which is fastest as it is converted without being copied (C=1 is taken as grayscale).
+            encode (bool): Return encoded images instead of grayscale arrays. Defaults to True.
+            input_formats (list): Extension of each input, e.g. '.jpg', used as its output format when
+                neither the processor nor the pipeline output sets one. Defaults to None: encoded inputs keep
+                the format detected from their header, arrays are encoded as PNG.
+            stats (dict): If given, 'read_seconds' (decoding), 'convert_seconds' and 'encode_seconds' are added to.
+
+        Returns:
+            list: For each input, a list with one result per pipeline output (an encoded 1-D uint8 array,
+                usable wherever bytes are, or a grayscale array), or None if it could not be decoded or encoded.
+        """
+        gray_images = self.to_grayscale_batch(images, stats, reuse_buffers=encode)
+        results = []
+        for index, gray_img in enumerate(gray_images):
+            if gray_img is None:
+                results.append(None)
+                continue
+            extensions = None
+            if encode:
+                default_format = (self.output_format or (input_formats[index] if input_formats else None)
+                                  or self._detect_format(images[index]))
+                extensions = [output.output_format or default_format for output in self.pipeline.outputs]
+            # A caller's grayscale array is passed through as a view and must not be overwritten
+            owned = not (isinstance(images[index], np.ndarray) and np.may_share_memory(gray_img, images[index]))
+            results.append(self._run_pipeline(gray_img, extensions, stats, owned))
+        return results
+
+    def to_grayscale_batch(self, images, stats=None, reuse_buffers=False):
+        """
+        Decodes and converts in-memory images to single-channel arrays, reduced by reduce_factor.
+        Encoded images are decoded straight to grayscale when fast_decode is set. Decoded color images
+        of the same shape are copied into one stacked buffer (an NxHxWxC array is used as it is) and
+        converted with a single cvtColor call, which runs OpenCV's vectorized loop once over the whole batch.
+
+        Args:
+            images (list or numpy.ndarray): As for convert_batch().
+            stats (dict): If given, 'read_seconds' and 'convert_seconds' are added to.
+            reuse_buffers (bool): Convert into this thread's scratch buffers. The results are then only
+                valid until the next call on the same thread. Defaults to False.
+
+        Returns:
+            list: A grayscale array per input, or None for inputs that could not be decoded.
+        """
+        read_started = time.perf_counter()
+        gray_images = [None] * len(images)
+        pending_reduce = [] # Indexes of images still at full size
+        color_groups = {} # (shape, dtype) -> [(index, color image)]
+        # An NxHxWx1 stack is already grayscale; its HxWx1 frames are handled like any other below
+        stacked = isinstance(images, np.ndarray) and images.ndim == 4 and images.shape[3] != 1
+        if stacked:
+            color_groups[(images.shape[1:], images.dtype.str)] = list(enumerate(images))
+        else:
+            for index, item in enumerate(images):
+                if isinstance(item, np.ndarray) and item.ndim >= 2:
+                    image = item
+                else:
+                    image, reduced = self._decode(item)
+                    if image is None:
+                        continue
+                    if reduced:
+                        gray_images[index] = image
+                        continue
+                if image.ndim == 2 or image.shape[2] == 1:
+                    gray_images[index] = image.reshape(image.shape[:2])
+                    pending_reduce.append(index)
+                else:
+                    color_groups.setdefault((image.shape, image.dtype.str), []).append((index, image))
+        convert_started = time.perf_counter()
+
+        gray_offsets = {} # (shape, dtype) -> byte offset of the group's results in the shared "gray" buffer
+        gray_bytes = 0
+        for (shape, dtype), group in color_groups.items():
+            gray_offsets[(shape, dtype)] = gray_bytes
+            # Rounded up to 64 bytes so every group's results start aligned
+            gray_bytes += (len(group) * shape[0] * shape[1] * np.dtype(dtype).itemsize + 63) // 64 * 64
+        # Every group gets its own slice, as the results of all groups are returned together
+        gray_buffer = self._buffer("gray", (gray_bytes,), np.uint8) if reuse_buffers and color_groups else None
+
+        for (shape, dtype), group in color_groups.items():
+            height, width, channels = shape
+            count = len(group)
+            if stacked:
+                source = np.ascontiguousarray(images) # Already stacked, no copy needed unless it is a strided view
+            elif count == 1:
+                source = group[0][1][None]
+            else:
+                source = (self._buffer("stacked", (count,) + shape, dtype) if reuse_buffers
+                          else np.empty((count,) + shape, dtype))
+                np.stack([image for _, image in group], out=source)
+            if gray_buffer is not None:
+                offset = gray_offsets[(shape, dtype)]
+                gray = gray_buffer[offset:offset + count * height * width * np.dtype(dtype).itemsize] \
+                    .view(dtype).reshape(count, height, width)
+            else:
+                gray = np.empty((count, height, width), dtype)
+            # Seen as one tall image, so a single call converts the whole group
+            cv2.cvtColor(source.reshape(count * height, width, channels),
+                         cv2.COLOR_BGR2GRAY if channels == 3 else cv2.COLOR_BGRA2GRAY,
+                         dst=gray.reshape(count * height, width))
+            for (index, _), gray_img in zip(group, gray):
+                gray_images[index] = gray_img
+            pending_reduce.extend(index for index, _ in group)
+
+        if self.reduce_factor > 1:
+            for index in pending_reduce:
+                height, width = gray_images[index].shape
+                gray_images[index] = cv2.resize(gray_images[index],
+                                                ((width + self.reduce_factor - 1) // self.reduce_factor,
+                                                 (height + self.reduce_factor - 1) // self.reduce_factor),
+                                                interpolation=cv2.INTER_AREA)
+        if stats is not None:
+            stats["read_seconds"] = stats.get("read_seconds", 0.0) + convert_started - read_started
+            stats["convert_seconds"] = stats.get("convert_seconds", 0.0) + time.perf_counter() - convert_started
+        return gray_images
+
+    def _decode(self, data):
+        """
+        Decodes an encoded image held in memory, or an image file given by its path (read by the codec
+        as it decodes, so the encoded file is never held in memory as a whole).
+
+        Returns:
+            tuple: (image, True) if the decoder already produced the reduced grayscale image, (image, False)
+                for a full-size decode still to be converted, or (None, False) if the data could not be decoded.
+        """
+        if isinstance(data, str):
+            decode = cv2.imread
+        else:
+            decode, data = cv2.imdecode, np.frombuffer(data, dtype=np.uint8)
+        if self.fast_decode:
+            gray_img = decode(data, GRAYSCALE_DECODE_FLAGS[self.reduce_factor])
+            if gray_img is not None:
+                return gray_img, True
+            # Some codecs can't decode straight to grayscale; fall back to the full decode below
+        # IMREAD_ANYCOLOR keeps single-channel sources as they are, so no conversion is needed
+        return decode(data, cv2.IMREAD_ANYCOLOR), False
+
+    @staticmethod
+    def _detect_format(item):
+        """Output extension for an input without one: its own format if it is encoded and recognized, else PNG."""
+        if not (isinstance(item, np.ndarray) and item.ndim >= 2):
+            header = bytes(memoryview(item).cast("B")[:12])
+            if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+                return ".webp"
+            for signature, extension in FORMAT_SIGNATURES:
+                if header.startswith(signature):
+                    return extension
+        return ".png"
+
+    def _run_pipeline(self, gray_img, extensions=None, stats=None, owned=False):
+        """
+        Runs the pipeline on one grayscale image and, if extensions are given, encodes every output.
+
+        Args:
+            gray_img (numpy.ndarray): The grayscale image.
+            extensions (list): Extension to encode each pipeline output to, e.g. '.png'. Defaults to None,
+                which returns the output arrays.
+            stats (dict): If given, 'convert_seconds' and 'encode_seconds' are added to.
+            owned (bool): gray_img was decoded or converted here, so pipeline stages may overwrite it.
+                Defaults to False: it is never modified.
+
+        Returns:
+            list: One encoded buffer (1-D uint8 array) or array per output, or None if encoding failed.
+        """
+        pipeline_started = time.perf_counter()
+        results = self.pipeline.run(gray_img, owned)
+        encode_started = time.perf_counter()
+        if stats is not None:
+            stats["convert_seconds"] = stats.get("convert_seconds", 0.0) + encode_started - pipeline_started
+        if extensions is None:
+            return [image for _, image in results]
+        outputs = []
+        for (output, image), extension in zip(results, extensions):
+            success, encoded = cv2.imencode(extension, image, self._encode_params(extension))
+            if not success:
+                logging.error(f"Could not encode the {output.name} output as {extension}")
+                return None
+            outputs.append(encoded)
+        if stats is not None:
+            stats["encode_seconds"] = stats.get("encode_seconds", 0.0) + time.perf_counter() - encode_started
+        return outputs
+
+    def _buffer(self, name, shape, dtype):
+        """
+        Returns a scratch array from this thread's buffers, grown when too small. Buffers above
+        BUFFER_REUSE_MAX_BYTES are not kept, so one huge image does not pin its memory afterwards.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if nbytes > BUFFER_REUSE_MAX_BYTES:
+            return np.empty(shape, dtype)
+        # Worker threads must not share scratch buffers, so every thread gets its own set
+        if self._local is None:
+            self._local = threading.local()
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        if name not in buffers or buffers[name].nbytes < nbytes:
+            buffers[name] = np.empty(nbytes, dtype=np.uint8)
+        return buffers[name][:nbytes].view(dtype).reshape(shape)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_local"] = None # Thread-local buffers cannot be pickled; each worker process makes its own
+        return state
+
+    def _encode_params(self, extension):
+        """
+        Builds the cv2.imwrite parameters for an output extension.
+
+        Returns:
+            list: Flat [flag, value, ...] list; empty to use OpenCV's defaults.
+        """
+        extension = extension.lower()
+        params = []
+        if extension in ('.jpg', '.jpeg'):
+            if self.jpeg_quality is not None:
+                params += [cv2.IMWRITE_JPEG_QUALITY, int(self.jpeg_quality)]
+            if self.jpeg_progressive:
+                params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+            if self.jpeg_optimize:
+                params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        elif extension == '.png':
+            if self.png_compression is not None:
+                params += [cv2.IMWRITE_PNG_COMPRESSION, int(self.png_compression)]
+        elif extension == '.webp':
+            if self.webp_quality is not None:
+                params += [cv2.IMWRITE_WEBP_QUALITY, int(self.webp_quality)]
+        return params
+
+    def estimate_memory(self, image_path):
+        """
+        Estimates the peak memory converting an image takes, from its header, for admission control.
+
+        Args:
+            image_path (str): Path to the input image.
+
+        Returns:
+            int: Estimated bytes, or 0 if the image size could not be read.
+        """
+        dimensions = image_dimensions(image_path)
+        if dimensions is None:
+            return 0
+        width, height = dimensions
+        pixels = width * height
+        output_pixels = -(-width // self.reduce_factor) * -(-height // self.reduce_factor)
+        extension = os.path.splitext(image_path)[1].lower()
+        if self._is_large(dimensions) and extension == ".bmp":
+            decode_bytes = output_pixels + STRIP_ROWS * width * 4 # The output plus one strip
+        elif self.fast_decode or self._is_large(dimensions):
+            # JPEG decodes reduced images directly; other codecs decode at full size and then shrink
+            decoded_pixels = output_pixels if extension in (".jpg", ".jpeg") else pixels
+            decode_bytes = GRAYSCALE_DECODE_BYTES_PER_PIXEL * decoded_pixels
+        else:
+            decode_bytes = COLOR_DECODE_BYTES_PER_PIXEL * pixels
+        # One buffer per stage result and one encoded output per variant, at most an output's size each
+        stage_buffers = sum(len(output.stages) + 1 for output in self.pipeline.outputs)
+        return decode_bytes + stage_buffers * output_pixels
+
+    def _is_large(self, dimensions):
+        return bool(self.large_image_pixels) and dimensions is not None \
+            and dimensions[0] * dimensions[1] > self.large_image_pixels
+
+    def _read_large_grayscale(self, image_path, dimensions):
+        """
+        Decodes a large image with as little memory as possible: uncompressed BMPs strip by strip through
+        one reused buffer, everything else straight to grayscale (even when fast_decode is off).
+
+        Returns:
+            numpy.ndarray: The grayscale image, or None to fall back to the regular decode.
+        """
+        if os.path.splitext(image_path)[1].lower() == ".bmp":
+            try:
+                gray_img = read_bmp_grayscale(image_path, self.reduce_factor)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Strip conversion of {image_path} failed, decoding normally: {e}")
+                gray_img = None
+            if gray_img is not None:
+                logging.info(f"Large image ({dimensions[0]}x{dimensions[1]}) converted in strips: {image_path}")
+                return gray_img
+        gray_img = cv2.imread(image_path, GRAYSCALE_DECODE_FLAGS[self.reduce_factor])
+        if gray_img is not None:
+            logging.info(f"Large image ({dimensions[0]}x{dimensions[1]}) decoded straight to grayscale: {image_path}")
+        return gray_img
+
+    def _read_grayscale(self, image_path, stats=None, reuse_buffers=False):
+        """
+        Decodes an image file into a single-channel array. Alpha channels are dropped, as with a plain
+        color decode. Images that are not decoded straight to grayscale are converted by
+        to_grayscale_batch(). If stats is given, 'read_seconds' and 'convert_seconds' are recorded.
+
+        Returns:
+            numpy.ndarray: The grayscale image, or None if it could not be decoded.
+        """
+        read_started = time.perf_counter()
+        if self.large_image_pixels:
+            dimensions = image_dimensions(image_path)
+            if self._is_large(dimensions):
+                gray_img = self._read_large_grayscale(image_path, dimensions)
+                if gray_img is not None:
+                    if stats is not None:
+                        stats["read_seconds"] = time.perf_counter() - read_started
+                        stats["convert_seconds"] = 0.0 # Done while decoding
+                    return gray_img
+        image, reduced = self._decode(image_path)
+        if stats is not None:
+            stats["read_seconds"] = time.perf_counter() - read_started
+            stats["convert_seconds"] = 0.0 # Done by the decoder, unless converted below
+        if image is None or reduced:
+            return image
+        return self.to_grayscale_batch([image], stats, reuse_buffers)[0]
+
+    def delete_original(self, image_path):
+        """
+        Deletes the original image file, or moves it to the archive folder if one is set.
+        Only call this once convert_to_grayscale has returned, as its output is then durable on disk.
+
+        Args:
+            image_path (str): Path to the image to delete.
+
+        Returns:
+            bool: True if the original was deleted or archived.
+        """
+        try:
+            if self.archive_folder:
+                archived_path = move_to_folder(image_path, self.archive_folder)
+                logging.log(PER_FILE, f"Archived original image: {image_path} to {archived_path}")
+            else:
+                os.remove(image_path)
+                logging.log(PER_FILE, f"Deleted original image: {image_path}")
+            return True
+        except Exception as e:
+            logging.error(f"Error deleting {image_path}: {e}")
+            return False
@@ -0,0 +1,164 @@
+# Header probing and strip-wise decoding, so very large images can be converted within a memory budget.
+
+import logging
+import struct
+
+import cv2
+import numpy as np
+
+# Rows converted at a time by the strip decoder (rounded to a multiple of the reduce factor)
+STRIP_ROWS = 256
+
+# BMP compression values: uncompressed, and uncompressed with explicit channel masks
+BI_RGB = 0
+BI_BITFIELDS = 3
+# Red, green and blue masks of plain BGRA pixels, as OpenCV writes 32-bit BMPs
+BGRA_MASKS = (0x00FF0000, 0x0000FF00, 0x000000FF)
+
+
+def image_dimensions(path):
+    """
+    Reads an image's size from its header without decoding it.
+
+    Args:
+        path (str): Path to a PNG, JPEG, BMP or GIF file.
+
+    Returns:
+        tuple: (width, height), or None if the format is not recognized or the header is damaged.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(64)
+            if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+            if header.startswith((b"GIF87a", b"GIF89a")):
+                return struct.unpack("<HH", header[6:10])
+            if header.startswith(b"BM"):
+                info = _bmp_info(header)
+                return (info["width"], info["height"]) if info else None
+            if header.startswith(b"\xff\xd8"):
+                f.seek(2)
+                return _jpeg_dimensions(f)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def _jpeg_dimensions(f):
+    """Walks the JPEG markers up to the first start-of-frame segment."""
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            continue # Markers without a length field
+        length = struct.unpack(">H", f.read(2))[0]
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def _bmp_info(header):
+    """
+    Parses the BMP file and info headers, or returns None for layouts the strip decoder does not handle.
+    The red, green and blue masks of BI_BITFIELDS files follow the 40-byte info header (or are part of
+    the larger V4/V5 headers), so they are read if the header bytes given reach that far.
+    """
+    pixel_offset, dib_size = struct.unpack("<II", header[10:18])
+    if dib_size == 12: # OS/2 BITMAPCOREHEADER
+        width, height, _, bits = struct.unpack("<HHHH", header[18:26])
+        compression = BI_RGB
+    elif dib_size >= 40:
+        width, height, _, bits, compression = struct.unpack("<iiHHI", header[18:34])
+    else:
+        return None
+    masks = None
+    if compression == BI_BITFIELDS and len(header) >= 66:
+        masks = struct.unpack("<III", header[54:66])
+    return {"width": width, "height": abs(height), "top_down": height < 0, "bits": bits,
+            "compression": compression, "masks": masks, "pixel_offset": pixel_offset, "dib_size": dib_size}
+
+
+def read_bmp_grayscale(path, reduce_factor=1, strip_rows=STRIP_ROWS):
+    """
+    Converts an uncompressed 8, 24 or 32-bit BMP to grayscale strip by strip. BMP pixels are stored
+    raw, so each strip is read straight into one reused buffer and converted; apart from the output,
+    only that buffer is ever held in memory. 32-bit BMPs may use BI_BITFIELDS (as OpenCV writes them)
+    if their masks are the plain BGRA layout.
+
+    A reduced image has the size OpenCV's IMREAD_REDUCED_* flags give a BMP (rounded down), each
+    output pixel being the mean of a reduce_factor x reduce_factor block.
+
+    Args:
+        path (str): Path to the BMP file.
+        reduce_factor (int): Downscale the result by this factor. Defaults to 1.
+        strip_rows (int): Rows converted at a time. Defaults to STRIP_ROWS.
+
+    Returns:
+        numpy.ndarray: The grayscale image, or None if the BMP uses a layout this reader does not handle
+            (compressed, bitfields other than BGRA, or fewer than 8 bits per pixel), in which case OpenCV
+            should decode it.
+    """
+    with open(path, "rb") as f:
+        header = f.read(70)
+        info = _bmp_info(header) if header.startswith(b"BM") and len(header) >= 34 else None
+        if info is None or info["bits"] not in (8, 24, 32):
+            return None
+        if not (info["compression"] == BI_RGB
+                or info["compression"] == BI_BITFIELDS and info["bits"] == 32 and info["masks"] == BGRA_MASKS):
+            return None
+        palette = None
+        if info["bits"] == 8:
+            entry_size = 3 if info["dib_size"] == 12 else 4
+            f.seek(14 + info["dib_size"])
+            raw_palette = np.frombuffer(f.read(256 * entry_size), dtype=np.uint8)
+            raw_palette = raw_palette[:len(raw_palette) // entry_size * entry_size].reshape(-1, entry_size)
+            # Gray level of every palette entry, so each strip is converted with a single lookup
+            palette = np.zeros(256, dtype=np.uint8)
+            palette[:len(raw_palette)] = cv2.cvtColor(np.ascontiguousarray(raw_palette[None, :, :3]),
+                                                      cv2.COLOR_BGR2GRAY)[0]
+
+        width, height = info["width"], info["height"]
+        channels = info["bits"] // 8
+        row_bytes = (width * channels + 3) & ~3 # Rows are padded to 4 bytes
+        # Rounded down like OpenCV's reduced BMP decode; leftover edge pixels are dropped
+        out_width = width // reduce_factor
+        gray = np.empty((height // reduce_factor, out_width), dtype=np.uint8)
+        strip_rows = max(reduce_factor, strip_rows // reduce_factor * reduce_factor)
+        buffer = np.empty((strip_rows, row_bytes), dtype=np.uint8)
+        conversion = {3: cv2.COLOR_BGR2GRAY, 4: cv2.COLOR_BGRA2GRAY}.get(channels)
+        for top in range(0, height, strip_rows):
+            bottom = min(height, top + strip_rows)
+            rows = bottom - top
+            # Bottom-up BMPs store the last image row first
+            first_stored_row = top if info["top_down"] else height - bottom
+            f.seek(info["pixel_offset"] + first_stored_row * row_bytes)
+            strip_buffer = buffer[:rows]
+            if f.readinto(memoryview(strip_buffer).cast("B")) != strip_buffer.nbytes:
+                raise ValueError(f"BMP pixel data is truncated: {path}")
+            if not info["top_down"]:
+                strip_buffer = strip_buffer[::-1]
+            strip = strip_buffer[:, :width * channels].reshape(rows, width, channels)
+            if palette is not None:
+                strip_gray = cv2.LUT(strip[:, :, 0], palette)
+            else:
+                strip_gray = cv2.cvtColor(strip, conversion)
+            if reduce_factor > 1:
+                out_top = top // reduce_factor
+                out_rows = rows // reduce_factor
+                if out_rows:
+                    # Cropped to whole blocks, so INTER_AREA averages exactly reduce_factor x reduce_factor pixels
+                    block = strip_gray[:out_rows * reduce_factor, :out_width * reduce_factor]
+                    gray[out_top:out_top + out_rows] = cv2.resize(block, (out_width, out_rows),
+                                                                  interpolation=cv2.INTER_AREA)
+            else:
+                gray[top:bottom] = strip_gray
+    logging.debug(f"Converted {path} in strips of {strip_rows} rows")
+    return gray
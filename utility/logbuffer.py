@@ -0,0 +1,53 @@
+# Thread-safe ring buffer of log lines that a UI can read incrementally.
+
+import threading
+from collections import deque
+
+
+class LogBuffer:
+    """
+    Keeps the most recent log entries, each tagged with an increasing sequence number,
+    so a reader can fetch only the entries it has not displayed yet.
+    """
+    def __init__(self, maxlen=200):
+        """
+        Initializes the LogBuffer.
+
+        Args:
+            maxlen (int): Number of entries to keep. Older entries are dropped. Defaults to 200.
+        """
+        self.maxlen = maxlen
+        self._entries = deque(maxlen=maxlen)
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        """
+        Adds an entry. Cheap and safe to call from any thread.
+
+        Args:
+            entry (str): The log line.
+        """
+        with self._lock:
+            self._entries.append(entry)
+            self._next_seq += 1
+
+    def since(self, seq):
+        """
+        Returns the entries added after the reader's last fetch.
+
+        Args:
+            seq (int): Sequence number returned by the previous call (0 on the first call).
+
+        Returns:
+            tuple: (list of new entries, sequence number to pass next time). If more than maxlen
+                entries arrived since seq, only the newest maxlen are returned.
+        """
+        with self._lock:
+            missing = min(self._next_seq - seq, len(self._entries))
+            if missing <= 0:
+                return [], self._next_seq
+            return list(self._entries)[-missing:], self._next_seq
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,167 @@
+# Asynchronous logging: records are queued on the calling thread and written by a background listener,
+# with duplicate suppression, optional JSON lines output and log file rotation.
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Level of the lines logged for every image (detected, converted, original deleted). Between DEBUG and
+# INFO, so logging at INFO skips them entirely during steady ingest while keeping everything else.
+PER_FILE = 15
+logging.addLevelName(PER_FILE, "FILE")
+
+# Identical messages repeated within this many seconds are written once
+DUPLICATE_WINDOW_SECONDS = 5
+
+
+def parse_level(name):
+    """
+    Converts a level name such as 'FILE', 'info' or '20' to its number.
+
+    Raises:
+        ValueError: If the name is not a known level.
+    """
+    if isinstance(name, int) or str(name).isdigit():
+        return int(name)
+    level = logging.getLevelName(str(name).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+class DuplicateFilter(logging.Filter):
+    """
+    Drops a record whose level and message were already written within the last window seconds,
+    such as the same error reported on every retry. The next copy written after the window notes
+    how many were dropped.
+    """
+    def __init__(self, window=DUPLICATE_WINDOW_SECONDS, max_tracked=1000):
+        """
+        Initializes the DuplicateFilter.
+
+        Args:
+            window (float): Seconds during which repeats of a message are dropped. Defaults to DUPLICATE_WINDOW_SECONDS.
+            max_tracked (int): Distinct recent messages remembered. Defaults to 1000.
+        """
+        super().__init__()
+        self.window = window
+        self.max_tracked = max_tracked
+        self._recent = OrderedDict() # (level, message) -> [time last written, repeats dropped since]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            seen = self._recent.get(key)
+            if seen is not None and now - seen[0] < self.window:
+                seen[1] += 1
+                return False
+            if seen is not None and seen[1]:
+                record.msg = f"{record.getMessage()} (repeated {seen[1]} more times)"
+                record.args = None
+            self._recent[key] = [now, 0]
+            self._recent.move_to_end(key)
+            if len(self._recent) > self.max_tracked:
+                self._recent.popitem(last=False)
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line, for log shippers and jq."""
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "module": record.module,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records for the listener thread. Forked worker processes inherit this handler but not the
+    listener thread, so there the records are written by the handlers directly, as before.
+    """
+    def __init__(self, record_queue, handlers):
+        super().__init__(record_queue)
+        self._pid = os.getpid()
+        self._handlers = handlers
+
+    def emit(self, record):
+        if os.getpid() == self._pid:
+            super().emit(record)
+            return
+        for handler in self._handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def setup_logging(log_folder=None, level=logging.INFO, json_lines=False, max_bytes=10 * 1024 * 1024,
+                  backup_count=5, rotate_when=None, console_level=None, file_prefix="app_session"):
+    """
+    Routes all logging through a queue to a background listener, so logging calls on the conversion
+    path never wait for disk. Replaces any handlers already on the root logger.
+
+    Args:
+        log_folder (str): Folder for a new timestamped log file. Defaults to None (no log file).
+        level (int): Lowest level written to the log file. PER_FILE includes the per-image lines,
+            INFO skips them. Defaults to logging.INFO.
+        json_lines (bool): Write the log file as JSON lines (.jsonl) instead of text. Defaults to False.
+        max_bytes (int): Start a new log file once this size is reached. Defaults to 10 MB.
+        backup_count (int): Rotated log files to keep. Defaults to 5.
+        rotate_when (str): Rotate by time instead of size, e.g. 'midnight' or 'H' (see
+            logging.handlers.TimedRotatingFileHandler). Defaults to None.
+        console_level (int): Also write text lines of at least this level to stderr. Defaults to None (no console).
+        file_prefix (str): Log file name prefix. Defaults to 'app_session'.
+
+    Returns:
+        tuple: (QueueListener, to stop() at exit so queued records are flushed; path of the log file or None).
+    """
+    handlers = []
+    log_path = None
+    text_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(module)s - %(message)s")
+    if log_folder:
+        os.makedirs(log_folder, exist_ok=True)
+        extension = "jsonl" if json_lines else "log"
+        log_path = os.path.join(log_folder, f"{file_prefix}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{extension}")
+        if rotate_when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(log_path, when=rotate_when,
+                                                                     backupCount=backup_count, encoding="utf-8")
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes,
+                                                                backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(JsonLinesFormatter() if json_lines else text_formatter)
+        file_handler.setLevel(level)
+        handlers.append(file_handler)
+    if console_level is not None:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(text_formatter)
+        console_handler.setLevel(console_level)
+        handlers.append(console_handler)
+    for handler in handlers:
+        # Filtered on the listener thread, so the hot path only pays for queueing the record
+        handler.addFilter(DuplicateFilter())
+
+    logger = logging.getLogger()
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+    # Records below every handler's level are dropped before they are even created
+    logger.setLevel(min([handler.level for handler in handlers] or [level]))
+    record_queue = queue.SimpleQueue()
+    logger.addHandler(_QueueHandler(record_queue, handlers))
+    listener = logging.handlers.QueueListener(record_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener, log_path
@@ -0,0 +1,287 @@
+# Throughput, latency and failure metrics for the conversion pipeline, with Prometheus and JSON export.
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fileops import atomic_write
+
+# Pipeline stages, in order. 'detect' is the wait from discovery until a worker picks the file up,
+# 'hash' the content hash taken for the dedup cache.
+STAGES = ("detect", "hash", "read", "convert", "encode", "write", "delete")
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram (not thread-safe on its own; PipelineMetrics holds the lock).
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last slot counts values above the largest bucket
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, fraction):
+        """
+        Estimates a percentile as the upper bound of the bucket it falls in. A percentile above the
+        largest bucket is reported as that bucket's bound (i.e. at least that long), so the value stays
+        finite and valid JSON.
+
+        Returns:
+            float: The estimate in seconds, or None if nothing was observed.
+        """
+        if not self.count:
+            return None
+        target = fraction * self.count
+        running = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            running += bucket_count
+            if running >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class PipelineMetrics:
+    """
+    Collects counters, per-stage latency histograms and recent throughput for the watcher pipeline.
+    Recording is a few additions under a lock; components skip it entirely when no metrics object is given.
+    """
+    def __init__(self, rate_window=10):
+        """
+        Initializes the PipelineMetrics.
+
+        Args:
+            rate_window (int): Seconds of history used for the files/sec and MB/sec rates. Defaults to 10.
+        """
+        self.rate_window = rate_window
+        self.started = time.time()
+        self.counters = {"files_processed": 0, "files_failed": 0, "retries": 0, "dead_lettered": 0,
+                         "bytes_read": 0, "bytes_written": 0, "dedup_hits": 0, "dedup_misses": 0}
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self._gauges = {}
+        self._recent = deque() # [second, files, bytes_read] per second with completions
+        self._lock = threading.Lock()
+
+    def set_gauge(self, name, read_value):
+        """
+        Registers a gauge whose value is read when a snapshot is taken.
+
+        Args:
+            name (str): Gauge name, e.g. 'queue_depth'.
+            read_value (function): Returns the current value.
+        """
+        self._gauges[name] = read_value
+
+    def record_success(self, stats, detected_at=None):
+        """
+        Records a converted file.
+
+        Args:
+            stats (dict): Stats filled in by process_image and ImageProcessor.convert_to_grayscale.
+            detected_at (float): time.time() when the watcher discovered the file, if known.
+        """
+        now = time.time()
+        second = int(now)
+        bytes_read = stats.get("bytes_read", 0)
+        with self._lock:
+            self.counters["files_processed"] += 1
+            self.counters["bytes_read"] += bytes_read
+            self.counters["bytes_written"] += stats.get("bytes_written", 0)
+            if "dedup" in stats:
+                self.counters["dedup_hits" if stats["dedup"] == "hit" else "dedup_misses"] += 1
+            if detected_at is not None and "started_at" in stats:
+                self.histograms["detect"].observe(max(0.0, stats["started_at"] - detected_at))
+            for stage in STAGES[1:]:
+                seconds = stats.get(f"{stage}_seconds")
+                if seconds is not None:
+                    self.histograms[stage].observe(seconds)
+            if self._recent and self._recent[-1][0] == second:
+                self._recent[-1][1] += 1
+                self._recent[-1][2] += bytes_read
+            else:
+                self._recent.append([second, 1, bytes_read])
+            while self._recent and self._recent[0][0] <= second - self.rate_window:
+                self._recent.popleft()
+
+    def increment(self, counter, amount=1):
+        """Adds to one of the counters, e.g. 'files_failed' or 'retries'."""
+        with self._lock:
+            self.counters[counter] += amount
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Current counters, rates, gauges and per-stage latency summaries.
+        """
+        now = time.time()
+        with self._lock:
+            recent = [bucket for bucket in self._recent if bucket[0] > now - self.rate_window]
+            counters = dict(self.counters)
+            stages = {stage: {"count": h.count,
+                              "mean_seconds": h.sum / h.count if h.count else None,
+                              "p50_seconds": h.percentile(0.5),
+                              "p95_seconds": h.percentile(0.95),
+                              "p99_seconds": h.percentile(0.99)}
+                      for stage, h in self.histograms.items()}
+        gauges = {}
+        for name, read_value in self._gauges.items():
+            try:
+                gauges[name] = read_value()
+            except Exception as e:
+                logging.debug(f"Could not read gauge {name}: {e}")
+        return {
+            "uptime_seconds": now - self.started,
+            "files_per_second": sum(bucket[1] for bucket in recent) / self.rate_window,
+            "mb_per_second": sum(bucket[2] for bucket in recent) / self.rate_window / 1e6,
+            "counters": counters,
+            "gauges": gauges,
+            "stages": stages,
+        }
+
+    def summary_text(self):
+        """Short one-line summary for a status bar."""
+        snap = self.snapshot()
+        counters = snap["counters"]
+        text = (f"{snap['files_per_second']:.1f} files/s, {snap['mb_per_second']:.1f} MB/s, "
+                f"queue {snap['gauges'].get('queue_depth', 0)}, "
+                f"done {counters['files_processed']}, failed {counters['files_failed']}")
+        if counters["dedup_hits"]:
+            text += f", duplicates {counters['dedup_hits']}"
+        return text
+
+    def to_prometheus(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text exposition format.
+        """
+        snap = self.snapshot()
+        lines = []
+
+        def metric(name, metric_type, help_text, value, labels=""):
+            lines.append(f"# HELP grayscaler_{name} {help_text}")
+            lines.append(f"# TYPE grayscaler_{name} {metric_type}")
+            lines.append(f"grayscaler_{name}{labels} {value}")
+
+        metric("files_processed_total", "counter", "Images converted successfully.", snap["counters"]["files_processed"])
+        metric("files_failed_total", "counter", "Failed conversion attempts.", snap["counters"]["files_failed"])
+        metric("retries_total", "counter", "Conversions scheduled for a retry.", snap["counters"]["retries"])
+        metric("dead_lettered_total", "counter", "Files moved to the dead-letter folder.", snap["counters"]["dead_lettered"])
+        metric("bytes_read_total", "counter", "Bytes of source images converted.", snap["counters"]["bytes_read"])
+        metric("bytes_written_total", "counter", "Bytes of output images written.", snap["counters"]["bytes_written"])
+        metric("dedup_hits_total", "counter", "Images whose outputs were reused from the dedup cache.",
+               snap["counters"]["dedup_hits"])
+        metric("dedup_misses_total", "counter", "Images converted after a dedup cache miss.", snap["counters"]["dedup_misses"])
+        metric("files_per_second", "gauge", f"Conversions per second over the last {self.rate_window}s.",
+               f"{snap['files_per_second']:.3f}")
+        metric("megabytes_per_second", "gauge", f"Source MB converted per second over the last {self.rate_window}s.",
+               f"{snap['mb_per_second']:.3f}")
+        for name, value in snap["gauges"].items():
+            metric(name, "gauge", f"Current {name.replace('_', ' ')}.", value)
+
+        lines.append("# HELP grayscaler_stage_seconds Per-stage latency of the conversion pipeline.")
+        lines.append("# TYPE grayscaler_stage_seconds histogram")
+        with self._lock:
+            for stage, h in self.histograms.items():
+                running = 0
+                for bound, bucket_count in zip(h.buckets, h.counts):
+                    running += bucket_count
+                    lines.append(f'grayscaler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {running}')
+                lines.append(f'grayscaler_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'grayscaler_stage_seconds_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'grayscaler_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Publishes PipelineMetrics as a Prometheus text file rewritten every interval (for the node_exporter
+    textfile collector), and/or over HTTP on localhost: /metrics (Prometheus) and /metrics.json.
+    """
+    def __init__(self, metrics, textfile_path=None, port=None, interval=5, host="127.0.0.1"):
+        """
+        Initializes the MetricsExporter.
+
+        Args:
+            metrics (PipelineMetrics): Metrics to publish.
+            textfile_path (str): Prometheus text file to keep up to date. Defaults to None.
+            port (int): Local port for the HTTP endpoint. Defaults to None (no server).
+            interval (float): Seconds between text file updates. Defaults to 5.
+            host (str): Address the HTTP endpoint binds to. Defaults to localhost only.
+        """
+        self.metrics = metrics
+        self.textfile_path = textfile_path
+        self.port = port
+        self.interval = interval
+        self.host = host
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+
+    def start(self):
+        """Starts the text file writer and/or HTTP server threads."""
+        if self.textfile_path:
+            thread = threading.Thread(target=self._write_periodically, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.port:
+            self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+            thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            logging.info(f"Serving metrics on http://{self.host}:{self._server.server_port}/metrics")
+
+    def stop(self):
+        """Stops the exporter, writing the text file one last time."""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self.textfile_path:
+            self.write_textfile()
+
+    def write_textfile(self):
+        try:
+            atomic_write(self.textfile_path, self.metrics.to_prometheus().encode("utf-8"))
+        except Exception as e:
+            logging.error(f"Could not write metrics file {self.textfile_path}: {e}")
+
+    def _write_periodically(self):
+        while not self._stop.wait(self.interval):
+            self.write_textfile()
+
+    def _make_handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.snapshot()).encode("utf-8"), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Keep scrapes out of the application log
+
+        return Handler
@@ -0,0 +1,364 @@
+# Declarative processing pipeline: one decoded grayscale image feeds several output variants.
+
+import json
+import os
+import threading
+
+import cv2
+
+INTERPOLATIONS = {
+    "area": cv2.INTER_AREA,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "nearest": cv2.INTER_NEAREST,
+}
+
+# Output formats that can be chosen instead of keeping the input's extension
+OUTPUT_FORMATS = ('.jpg', '.png', '.webp', '.bmp')
+
+
+def normalize_format(output_format):
+    """
+    Turns 'JPEG', 'jpg' or '.jpg' into '.jpg', and rejects unsupported formats.
+
+    Returns:
+        str: The extension, or None if output_format is None.
+
+    Raises:
+        ValueError: If the format is not one of OUTPUT_FORMATS.
+    """
+    if output_format is None:
+        return None
+    output_format = "." + output_format.lower().lstrip(".")
+    if output_format == ".jpeg":
+        output_format = ".jpg"
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got {output_format}")
+    return output_format
+
+
+class Stage:
+    """
+    Base class for pipeline stages. A stage transforms a 2-D uint8 array.
+    Stages only hold plain settings, so ImageProcessor stays picklable for worker processes.
+    """
+    type_name = None
+    # True if apply() can write its result into the input buffer
+    in_place = False
+
+    def config(self):
+        """
+        Returns:
+            dict: The stage's settings, in the form read by stage_from_config.
+        """
+        raise NotImplementedError
+
+    @property
+    def key(self):
+        """Hashable identity of the stage, used to share identical work between outputs."""
+        return tuple(sorted(self.config().items()))
+
+    def apply(self, image, in_place=False):
+        """
+        Transforms an image.
+
+        Args:
+            image (numpy.ndarray): 2-D uint8 input.
+            in_place (bool): The input is not used elsewhere and may be overwritten.
+
+        Returns:
+            numpy.ndarray: The result (the input itself if nothing had to change).
+        """
+        raise NotImplementedError
+
+
+class Resize(Stage):
+    """
+    Resizes to an exact width and/or height (keeping the aspect ratio if only one is given), or by a scale factor.
+    """
+    type_name = "resize"
+
+    def __init__(self, width=None, height=None, scale=None, interpolation="area"):
+        if not (width or height or scale):
+            raise ValueError("resize needs a width, a height or a scale")
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"interpolation must be one of {sorted(INTERPOLATIONS)}, got {interpolation}")
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.interpolation = interpolation
+
+    def config(self):
+        return {"type": self.type_name, "width": self.width, "height": self.height, "scale": self.scale,
+                "interpolation": self.interpolation}
+
+    def target_size(self, width, height):
+        """Returns the (width, height) an image of the given size is resized to."""
+        if self.scale:
+            return max(1, round(width * self.scale)), max(1, round(height * self.scale))
+        if self.width and self.height:
+            return self.width, self.height
+        if self.width:
+            return self.width, max(1, round(height * self.width / width))
+        return max(1, round(width * self.height / height)), self.height
+
+    def apply(self, image, in_place=False):
+        height, width = image.shape[:2]
+        size = self.target_size(width, height)
+        if size == (width, height):
+            return image
+        return cv2.resize(image, size, interpolation=INTERPOLATIONS[self.interpolation])
+
+
+class Thumbnail(Resize):
+    """
+    Shrinks the image to fit in a size x size box, keeping the aspect ratio. Smaller images are left as they are.
+    """
+    type_name = "thumbnail"
+
+    def __init__(self, size=256, interpolation="area"):
+        super().__init__(width=size, height=size, interpolation=interpolation)
+        self.size = size
+
+    def config(self):
+        return {"type": self.type_name, "size": self.size, "interpolation": self.interpolation}
+
+    def target_size(self, width, height):
+        factor = min(1.0, self.size / max(width, height))
+        return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+class Clahe(Stage):
+    """
+    Auto-contrast with CLAHE (contrast limited adaptive histogram equalization).
+    """
+    type_name = "clahe"
+    in_place = True
+
+    def __init__(self, clip_limit=2.0, tile_size=8):
+        self.clip_limit = clip_limit
+        self.tile_size = tile_size
+        self._local = None
+
+    def config(self):
+        return {"type": self.type_name, "clip_limit": self.clip_limit, "tile_size": self.tile_size}
+
+    def apply(self, image, in_place=False):
+        # cv2.CLAHE keeps scratch buffers, so every worker thread gets its own instance
+        if self._local is None:
+            self._local = threading.local()
+        clahe = getattr(self._local, "clahe", None)
+        if clahe is None:
+            clahe = self._local.clahe = cv2.createCLAHE(clipLimit=self.clip_limit,
+                                                        tileGridSize=(self.tile_size, self.tile_size))
+        return clahe.apply(image, dst=image) if in_place else clahe.apply(image)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_local"] = None # Neither thread-locals nor cv2.CLAHE objects can be pickled
+        return state
+
+
+STAGE_TYPES = {stage.type_name: stage for stage in (Resize, Thumbnail, Clahe)}
+
+
+def stage_from_config(config):
+    """
+    Creates a stage from a dict such as {"type": "clahe", "clip_limit": 3}.
+
+    Raises:
+        ValueError: If the type is unknown or a setting is invalid.
+    """
+    settings = dict(config)
+    type_name = settings.pop("type", None)
+    if type_name not in STAGE_TYPES:
+        raise ValueError(f"Unknown stage type {type_name!r}; expected one of {sorted(STAGE_TYPES)}")
+    try:
+        return STAGE_TYPES[type_name](**settings)
+    except TypeError as e:
+        raise ValueError(f"Invalid settings for stage {type_name!r}: {e}")
+
+
+class OutputVariant:
+    """
+    One output written per input image: a list of stages plus where and how the result is saved.
+    """
+    def __init__(self, name="gray", stages=(), suffix="", subfolder=None, output_format=None):
+        """
+        Initializes the OutputVariant.
+
+        Args:
+            name (str): Name shown in logs. Defaults to 'gray'.
+            stages (list): Stages applied to the decoded grayscale image, in order. Defaults to none.
+            suffix (str): Appended to the file name before the extension, e.g. '_clahe'. Defaults to ''.
+            subfolder (str): Subfolder of the output folder to save to, e.g. 'thumbnails'. Defaults to None.
+            output_format (str): Format for this output, e.g. 'jpg' or '.jpeg', overriding the processor's format.
+                Defaults to None.
+
+        Raises:
+            ValueError: If output_format is not one of OUTPUT_FORMATS.
+        """
+        self.name = name
+        self.stages = list(stages)
+        self.suffix = suffix
+        self.subfolder = subfolder
+        self.output_format = normalize_format(output_format or None)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates an OutputVariant from a dict with 'name', 'stages', 'suffix', 'subfolder' and 'format' keys.
+        """
+        return cls(name=config.get("name", "gray"),
+                   stages=[stage_from_config(stage) for stage in config.get("stages", [])],
+                   suffix=config.get("suffix", ""), subfolder=config.get("subfolder"),
+                   output_format=config.get("format"))
+
+    def config(self):
+        """
+        Returns:
+            dict: The variant's settings, in the form read by from_config.
+        """
+        return {"name": self.name, "stages": [stage.config() for stage in self.stages], "suffix": self.suffix,
+                "subfolder": self.subfolder, "format": self.output_format}
+
+    def output_path(self, output_folder, filename, default_format=None):
+        """
+        Returns the path this variant saves the output of filename to.
+
+        Args:
+            output_folder (str): The processor's (or mirrored) output folder.
+            filename (str): Name of the input image.
+            default_format (str): Extension used when the variant has none. Defaults to keeping the input's.
+        """
+        base, extension = os.path.splitext(os.path.basename(filename))
+        extension = self.output_format or default_format or extension
+        folder = os.path.join(output_folder, self.subfolder) if self.subfolder else output_folder
+        return os.path.join(folder, base + self.suffix + extension)
+
+
+class Pipeline:
+    """
+    A set of output variants fed by a single decode. Stages shared by several variants
+    (e.g. a CLAHE step before both a full-size and a thumbnail output) run once, and a stage
+    that can work in place does so whenever its input buffer is not needed by another output.
+    """
+    def __init__(self, outputs=None):
+        """
+        Initializes the Pipeline.
+
+        Args:
+            outputs (list): OutputVariant objects. Defaults to a single plain grayscale output.
+
+        Raises:
+            ValueError: If two outputs would be written to the same file.
+        """
+        self.outputs = list(outputs) if outputs else [OutputVariant()]
+        destinations = [(output.subfolder, output.suffix, output.output_format) for output in self.outputs]
+        if len(set(destinations)) != len(destinations):
+            raise ValueError("Pipeline outputs need distinct subfolders, suffixes or formats")
+        # How many outputs start with each stage prefix; a buffer used by one output only may be overwritten
+        self._prefix_users = {}
+        for output in self.outputs:
+            for depth in range(len(output.stages) + 1):
+                prefix = tuple(stage.key for stage in output.stages[:depth])
+                self._prefix_users[prefix] = self._prefix_users.get(prefix, 0) + 1
+
+    def check_destinations(self, default_format=None):
+        """
+        Checks that no two outputs are written to the same file once the outputs without a format of
+        their own get default_format.
+
+        Args:
+            default_format (str): The processor's output format. None keeps each input's extension,
+                which can be the format of any other output in the same subfolder with the same suffix.
+
+        Raises:
+            ValueError: If two outputs would be written to the same file.
+        """
+        formats = {} # (subfolder, suffix) -> formats of the outputs written there
+        for output in self.outputs:
+            formats.setdefault((output.subfolder, output.suffix), []).append(output.output_format or default_format)
+        for shared in formats.values():
+            if len(set(shared)) != len(shared) or (None in shared and len(shared) > 1):
+                raise ValueError("Pipeline outputs need distinct subfolders, suffixes or formats")
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a Pipeline from a dict {"outputs": [...]} or a plain list of output configs.
+        See OutputVariant.from_config for the keys of each output.
+        """
+        outputs = config.get("outputs", []) if isinstance(config, dict) else config
+        return cls([OutputVariant.from_config(output) for output in outputs])
+
+    @classmethod
+    def from_file(cls, path):
+        """Loads a Pipeline from a JSON file in the format read by from_config."""
+        with open(path) as f:
+            return cls.from_config(json.load(f))
+
+    def config(self):
+        """
+        Returns:
+            dict: The pipeline's settings, in the form read by from_config.
+        """
+        return {"outputs": [output.config() for output in self.outputs]}
+
+    @classmethod
+    def from_options(cls, resize=None, clahe=False, thumbnail=None):
+        """
+        Builds the common pipelines offered by the GUI and the command line.
+
+        Args:
+            resize (tuple): (width, height) of the main output; either may be None to keep the aspect ratio.
+            clahe (bool): Apply CLAHE auto-contrast to every output. Defaults to False.
+            thumbnail (int): Also save thumbnails fitting in this many pixels to a 'thumbnails' subfolder.
+        """
+        shared = [Clahe()] if clahe else []
+        main_stages = shared + ([Resize(width=resize[0], height=resize[1])] if resize else [])
+        outputs = [OutputVariant("gray", main_stages)]
+        if thumbnail:
+            outputs.append(OutputVariant("thumbnail", shared + [Thumbnail(thumbnail)], subfolder="thumbnails"))
+        return cls(outputs)
+
+    @property
+    def is_default(self):
+        """True for a single output without stages, i.e. the plain grayscale conversion."""
+        return len(self.outputs) == 1 and not self.outputs[0].stages and not self.outputs[0].subfolder \
+            and not self.outputs[0].suffix and not self.outputs[0].output_format
+
+    def run(self, image, owned=False):
+        """
+        Runs every output's stages on a decoded image.
+
+        Args:
+            image (numpy.ndarray): The decoded grayscale image.
+            owned (bool): The image is a fresh decode that nobody else holds, so the first stage may overwrite
+                it when only one output uses it. Defaults to False: the image is never modified.
+
+        Returns:
+            list: (OutputVariant, numpy.ndarray) for each output, in order.
+        """
+        results = {(): image}
+        outputs = []
+        for output in self.outputs:
+            prefix = ()
+            current = image
+            for stage in output.stages:
+                next_prefix = prefix + (stage.key,)
+                if next_prefix not in results:
+                    # The decoded image is only overwritten if owned; intermediates only if no other output needs them.
+                    # A stage that changed nothing passes its input through, so buffers are compared by identity.
+                    writable = (owned or current is not image) and self._prefix_users[prefix] == 1 and not any(
+                        result is current for key, result in results.items() if key != prefix)
+                    results[next_prefix] = stage.apply(current, in_place=stage.in_place and writable)
+                prefix = next_prefix
+                current = results[prefix]
+            outputs.append((output, current))
+        return outputs
+
+    def describe(self):
+        """Short description for logs, e.g. 'gray [clahe, resize], thumbnail [clahe, thumbnail]'."""
+        return ", ".join(f"{output.name} [{', '.join(stage.type_name for stage in output.stages)}]"
+                         if output.stages else output.name for output in self.outputs)
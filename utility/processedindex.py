@@ -0,0 +1,132 @@
+# Bounded, persistent record of files that have already been processed.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Lookup hits are remembered in memory and their last_seen times written in one transaction per this many hits
+TOUCH_BATCH_SIZE = 1000
+
+
+class ProcessedIndex:
+    """
+    Remembers processed files in SQLite, keyed by (path, size, mtime, inode), so a new file that
+    reuses an old name is still processed. Lookups go straight to the database, so nothing is loaded
+    at startup and lookups are read-only; the last_seen times of hits are written in batches. Once more
+    than max_entries are stored, the least recently seen entries are evicted.
+    """
+    def __init__(self, index_path=None, max_entries=100000):
+        """
+        Initializes the ProcessedIndex.
+
+        Args:
+            index_path (str): SQLite file to keep the index in. Defaults to None, which keeps it in memory only.
+            max_entries (int): Entries to keep before evicting the least recently seen. Defaults to 100000.
+        """
+        self.index_path = index_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._touched = {} # key -> time of the last lookup hit not yet written to last_seen
+        if index_path:
+            folder = os.path.dirname(os.path.abspath(index_path))
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(index_path or ":memory:", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            " path TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL,"
+            " last_seen REAL NOT NULL, PRIMARY KEY (path, size, mtime_ns, inode)) WITHOUT ROWID")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS processed_last_seen ON processed (last_seen)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+        logging.info(f"Processed-file index opened: {index_path or 'in memory'} ({self._count} entries)")
+
+    @staticmethod
+    def key_for(path):
+        """
+        Builds the index key for a file.
+
+        Args:
+            path (str): Path to the file.
+
+        Returns:
+            tuple: (absolute path, size, mtime_ns, inode), or None if the file does not exist.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def __contains__(self, key):
+        if key is None:
+            return False
+        key = tuple(key)
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT 1 FROM processed WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                key).fetchone() is not None
+            if found:
+                self._touched[key] = time.time()
+                if len(self._touched) >= TOUCH_BATCH_SIZE:
+                    self._flush_touched()
+                    self._conn.commit()
+            return found
+
+    def __len__(self):
+        return self._count
+
+    def add(self, key):
+        """
+        Records a file as processed.
+
+        Args:
+            key (tuple): Key from key_for().
+        """
+        if key is None:
+            return
+        with self._lock:
+            now = time.time()
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO processed (path, size, mtime_ns, inode, last_seen) VALUES (?, ?, ?, ?, ?)",
+                tuple(key) + (now,))
+            if cursor.rowcount > 0:
+                self._count += 1
+            else:
+                self._conn.execute(
+                    "UPDATE processed SET last_seen = ? WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                    (now,) + tuple(key))
+            self._touched.pop(tuple(key), None)
+            if self._count > self.max_entries:
+                self._flush_touched()
+                self._evict()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE processed SET last_seen = ? WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            [(seen,) + key for key, seen in self._touched.items()])
+        self._touched.clear()
+
+    def _evict(self):
+        # Drop an extra 10% so eviction runs once per batch of inserts instead of on every insert
+        excess = self._count - int(self.max_entries * 0.9)
+        cutoff = self._conn.execute(
+            "SELECT last_seen FROM processed ORDER BY last_seen LIMIT 1 OFFSET ?", (excess - 1,)).fetchone()
+        if cutoff is None:
+            return
+        evicted = self._conn.execute("DELETE FROM processed WHERE last_seen <= ?", cutoff).rowcount
+        self._count -= evicted
+        logging.info(f"Processed-file index evicted {evicted} old entries.")
+
+    def close(self):
+        """Closes the index database."""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,97 @@
+# Retry scheduling with exponential backoff, and the dead-letter folder for files that keep failing.
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from .fileops import move_to_folder
+
+
+class RetryQueue:
+    """
+    Holds items that failed and should be tried again later.
+    The delay doubles on every attempt, up to max_delay.
+    """
+    def __init__(self, max_attempts=5, base_delay=1, max_delay=60):
+        """
+        Initializes the RetryQueue.
+
+        Args:
+            max_attempts (int): Total attempts (including the first) before giving up. Defaults to 5.
+            base_delay (float): Delay before the first retry, in seconds. Defaults to 1.
+            max_delay (float): Upper bound for the delay between attempts, in seconds. Defaults to 60.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []
+        self._attempts = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def record_failure(self, item):
+        """
+        Records a failed attempt and schedules a retry if attempts remain.
+
+        Args:
+            item: The item that failed (hashable).
+
+        Returns:
+            tuple: (attempts so far, retry delay in seconds), with a delay of None when no attempts remain.
+        """
+        with self._lock:
+            attempts = self._attempts.get(item, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(item, None)
+                return attempts, None
+            self._attempts[item] = attempts
+            delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), item))
+            return attempts, delay
+
+    def record_success(self, item):
+        """Forgets the failure history of an item."""
+        with self._lock:
+            self._attempts.pop(item, None)
+
+    def forget(self, item):
+        """Drops the failure history of an item that will not be retried, e.g. because it was deleted."""
+        with self._lock:
+            self._attempts.pop(item, None)
+
+    def pop_due(self):
+        """
+        Returns:
+            list: Items whose retry time has come, oldest first.
+        """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def move_to_dead_letter(path, dead_letter_folder):
+    """
+    Moves a file that keeps failing into the dead-letter folder, without overwriting earlier entries.
+
+    Args:
+        path (str): Path to the file.
+        dead_letter_folder (str): Folder for files that could not be processed.
+
+    Returns:
+        str: The new path of the file, or None if it could not be moved.
+    """
+    try:
+        destination = move_to_folder(path, dead_letter_folder)
+        logging.warning(f"Moved {path} to dead-letter folder: {destination}")
+        return destination
+    except Exception as e:
+        logging.error(f"Could not move {path} to dead-letter folder {dead_letter_folder}: {e}")
+        return None
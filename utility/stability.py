@@ -0,0 +1,63 @@
+# Decides when a newly seen file has finished being written.
+
+import os
+import threading
+import time
+
+STABLE = "stable"
+PENDING = "pending"
+MISSING = "missing"
+
+
+class StabilityTracker:
+    """
+    Tracks the size and modification time of files that are still settling.
+    A file counts as completely written once it has not been modified for settle_time
+    seconds, or once its size and mtime are unchanged between two checks settle_time apart.
+    """
+    def __init__(self, settle_time=2):
+        """
+        Initializes the StabilityTracker.
+
+        Args:
+            settle_time (float): Seconds a file must stay unchanged before it is processed. Defaults to 2.
+        """
+        self.settle_time = settle_time
+        self._observations = {}  # path -> (size, mtime_ns, first time this size/mtime was seen)
+        self._lock = threading.Lock()
+
+    def check(self, path):
+        """
+        Checks whether a file has finished being written.
+
+        Args:
+            path (str): Path to the file.
+
+        Returns:
+            str: STABLE, PENDING, or MISSING if the file no longer exists.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.forget(path)
+            return MISSING
+
+        now = time.time()
+        signature = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            previous = self._observations.get(path)
+            if previous is None or previous[:2] != signature:
+                self._observations[path] = signature + (now,)
+                unchanged_for = 0
+            else:
+                unchanged_for = now - previous[2]
+
+        if (st.st_size > 0 and now - st.st_mtime >= self.settle_time) or unchanged_for >= self.settle_time:
+            self.forget(path)
+            return STABLE
+        return PENDING
+
+    def forget(self, path):
+        """Drops any observation recorded for a file."""
+        with self._lock:
+            self._observations.pop(path, None)
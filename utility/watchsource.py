@@ -0,0 +1,96 @@
+# Describes one folder tree watched by FileWatcher and where its outputs go.
+
+import fnmatch
+import os
+
+from .dirwatch import is_image_file
+
+
+class WatchSource:
+    """
+    A root folder to watch, with its own include/exclude globs and optional output folder.
+    Globs are matched against the path relative to the root (with '/' separators) and against the file name.
+    """
+    def __init__(self, root, output_folder=None, recursive=False, include=None, exclude=None):
+        """
+        Initializes the WatchSource.
+
+        Args:
+            root (str): Folder to watch.
+            output_folder (str): Where this root's outputs go. Defaults to None, which uses the
+                ImageProcessor's output folder.
+            recursive (bool): Also watch subfolders; outputs mirror the subfolder structure. Defaults to False.
+            include (list): Only process files matching one of these globs, e.g. ['*.jpg', 'cam1/*'].
+                Defaults to None (all supported images).
+            exclude (list): Skip files and subfolders matching one of these globs. Defaults to None.
+        """
+        self.root = os.path.abspath(root)
+        self.output_folder = output_folder
+        self.recursive = recursive
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.skip_folders = set() # Absolute folders never descended into, e.g. an output folder inside the root
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a WatchSource from a dict, e.g. one entry of a JSON sources file.
+
+        Args:
+            config (dict): Keys 'root' and optionally 'output', 'recursive', 'include' and 'exclude'.
+        """
+        return cls(config["root"], output_folder=config.get("output"), recursive=config.get("recursive", False),
+                   include=config.get("include"), exclude=config.get("exclude"))
+
+    def relative_path(self, path):
+        """Returns path relative to the root, with the platform's separators."""
+        return os.path.relpath(path, self.root)
+
+    def _matches_any(self, relative_path, patterns):
+        posix_path = relative_path.replace(os.sep, "/")
+        name = os.path.basename(relative_path)
+        return any(fnmatch.fnmatch(posix_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+    def matches(self, path):
+        """
+        Checks whether a file under this root should be processed.
+
+        Args:
+            path (str): Absolute path of the file.
+        """
+        if not is_image_file(path):
+            return False
+        relative_path = self.relative_path(path)
+        if self.include and not self._matches_any(relative_path, self.include):
+            return False
+        return not self._matches_any(relative_path, self.exclude)
+
+    def should_descend(self, folder):
+        """
+        Checks whether a subfolder should be watched. Hidden folders and skip_folders never are.
+
+        Args:
+            folder (str): Absolute path of the subfolder.
+        """
+        if not self.recursive or os.path.basename(folder).startswith("."):
+            return False
+        if os.path.abspath(folder) in self.skip_folders:
+            return False
+        return not self._matches_any(self.relative_path(folder), self.exclude)
+
+    def output_folder_for(self, path, default_output_folder):
+        """
+        Returns the folder an image's output goes to, mirroring its subfolder under the output folder.
+
+        Args:
+            path (str): Absolute path of the image.
+            default_output_folder (str): Output folder used when this source has none of its own.
+        """
+        base_folder = self.output_folder or default_output_folder
+        subfolder = os.path.dirname(self.relative_path(path))
+        return os.path.join(base_folder, subfolder) if subfolder else base_folder
+
+    def skip(self, folder):
+        """Never descend into folder (if it is inside this root), e.g. because outputs are written there."""
+        if folder:
+            self.skip_folders.add(os.path.abspath(folder))
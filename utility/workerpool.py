@@ -0,0 +1,172 @@
+# Bounded worker pool used to convert images off the watcher thread.
+
+import concurrent.futures
+import logging
+import threading
+import time
+
+
+def process_image(image_processor, image_path, filename, delete_original=True, output_folder=None):
+    """
+    Converts a single image and, if asked, deletes the original only if conversion succeeded.
+    Runs inside a pool worker (thread or process), so it must stay a module-level function.
+
+    Args:
+        image_processor (ImageProcessor): Processor used for the conversion.
+        image_path (str): Path to the input image.
+        filename (str): Name of the image file.
+        delete_original (bool): Delete the input after a successful conversion. Defaults to True.
+        output_folder (str): Save to this folder instead of the processor's output folder. Defaults to None.
+
+    Returns:
+        tuple: (path to the saved grayscale image or None on failure, dict of stage timings and sizes).
+    """
+    stats = {"started_at": time.time()} # Wall clock, so it can be compared across processes
+    gray_path = image_processor.convert_to_grayscale(image_path, filename, stats, output_folder)
+    if gray_path and delete_original:
+        delete_started = time.perf_counter()
+        image_processor.delete_original(image_path)
+        stats["delete_seconds"] = time.perf_counter() - delete_started
+    return gray_path, stats
+
+
+class MemoryBudget:
+    """
+    Admission control for memory-hungry jobs: a job reserves its estimated bytes before it is queued
+    and gives them back when it finishes. A job larger than the whole budget is admitted only when
+    nothing else holds a reservation, so it runs alone instead of never running.
+    """
+    def __init__(self, max_bytes):
+        """
+        Initializes the MemoryBudget.
+
+        Args:
+            max_bytes (int): Total bytes the admitted jobs may use at once.
+        """
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes, stop_event=None):
+        """
+        Waits until nbytes fit in the budget and reserves them.
+
+        Args:
+            nbytes (int): Estimated bytes the job needs.
+            stop_event (threading.Event): If set while waiting, give up.
+
+        Returns:
+            int: Bytes actually reserved (capped at the budget), to pass to release(), or None if stop_event was set.
+        """
+        nbytes = min(nbytes, self.max_bytes)
+        with self._condition:
+            while self.in_use + nbytes > self.max_bytes:
+                if stop_event is not None and stop_event.is_set():
+                    return None
+                self._condition.wait(timeout=0.2)
+            self.in_use += nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        """Returns bytes reserved by acquire()."""
+        with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+
+class WorkerPool:
+    """
+    Runs jobs on a thread or process pool fed by a bounded queue.
+    Submitting blocks once max_pending jobs are queued or running, which gives the
+    producer (the watcher thread) backpressure when the workers fall behind.
+    """
+    def __init__(self, workers=1, use_processes=False, max_pending=None, memory_budget=None):
+        """
+        Initializes the WorkerPool.
+
+        Args:
+            workers (int): Number of worker threads or processes. Defaults to 1.
+            use_processes (bool): Use a process pool instead of threads. cv2 releases the GIL,
+                so threads are usually enough. Defaults to False.
+            max_pending (int): Maximum number of jobs queued or running at once.
+                Defaults to four times the worker count.
+            memory_budget (int): Bytes that queued and running jobs may use together, going by the cost
+                given to submit(). Defaults to None (no limit).
+        """
+        self.workers = max(1, int(workers))
+        self.use_processes = use_processes
+        self.max_pending = max(self.workers, int(max_pending or self.workers * 4))
+        executor_class = (concurrent.futures.ProcessPoolExecutor if use_processes
+                          else concurrent.futures.ThreadPoolExecutor)
+        self.executor = executor_class(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.memory_budget = MemoryBudget(memory_budget) if memory_budget else None
+        logging.info(f"Worker pool started: {self.workers} {'processes' if use_processes else 'threads'}, "
+                     f"queue limit {self.max_pending}"
+                     + (f", memory budget {memory_budget / 1e6:.0f} MB" if memory_budget else ""))
+
+    @property
+    def pending(self):
+        """Number of jobs currently queued or running."""
+        return self._pending
+
+    def submit(self, callback, fn, *args, stop_event=None, cost=0):
+        """
+        Queues fn(*args) and calls callback(future) once it finishes.
+        Blocks while the queue is full, or while the job's cost does not fit in the memory budget.
+
+        Args:
+            callback (function): Called with the finished future, from a pool thread.
+            fn (function): The job to run.
+            stop_event (threading.Event): If set while waiting for a free slot, give up.
+            cost (int): Estimated peak memory of the job in bytes, checked against the memory budget. Defaults to 0.
+
+        Returns:
+            bool: True if the job was queued, False if stop_event was set first.
+        """
+        while not self._slots.acquire(timeout=0.2):
+            if stop_event is not None and stop_event.is_set():
+                return False
+        reserved = 0
+        if self.memory_budget is not None and cost:
+            reserved = self.memory_budget.acquire(cost, stop_event)
+            if reserved is None:
+                self._slots.release()
+                return False
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._release_slot(reserved)
+            raise
+        future.add_done_callback(lambda f: self._on_done(f, callback, reserved))
+        return True
+
+    def _on_done(self, future, callback, reserved=0):
+        try:
+            if not future.cancelled():
+                callback(future)
+        except Exception as e:
+            logging.error(f"Error in worker pool callback: {e}")
+        finally:
+            self._release_slot(reserved)
+
+    def _release_slot(self, reserved=0):
+        if reserved:
+            self.memory_budget.release(reserved)
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def shutdown(self, cancel_pending=True):
+        """
+        Stops the pool. Jobs already running are allowed to finish.
+
+        Args:
+            cancel_pending (bool): Drop jobs that have not started yet. Defaults to True.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=cancel_pending)
+        logging.info("Worker pool shut down.")